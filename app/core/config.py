@@ -1,13 +1,69 @@
 from pydantic_settings import BaseSettings
 from pydantic import Field
+from typing import Optional
 
 class Settings(BaseSettings):
-    X_BEARER_TOKEN: str = Field(..., env='X_BEARER_TOKEN')
-    GEMINI_API_KEY: str = Field(..., env='GEMINI_API_KEY')
+    # Only needed by processes that run workflows; checked when the clients are first used.
+    X_BEARER_TOKEN: Optional[str] = Field(None, env='X_BEARER_TOKEN')
+    GEMINI_API_KEY: Optional[str] = Field(None, env='GEMINI_API_KEY')
     MONGODB_URI: str = Field("mongodb://localhost:27017", env="MONGODB_URI")
     MONGODB_DB_NAME: str = Field("workflow_db", env="MONGODB_DB_NAME")
     CELERY_BROKER_URL: str = Field("pyamqp://guest@localhost//", env="CELERY_BROKER_URL")
     CELERY_RESULT_BACKEND: str = Field("mongodb://localhost:27017", env="CELERY_RESULT_BACKEND")
+    TASK_RETENTION_DAYS: int = Field(30, env="TASK_RETENTION_DAYS")
+    REDIS_URL: Optional[str] = Field(None, env="REDIS_URL")
+    WORKFLOW_LARGE_MAX_TWEETS: int = Field(500, env="WORKFLOW_LARGE_MAX_TWEETS")
+    WORKFLOW_BACKFILL_PERIOD: str = Field("2d", env="WORKFLOW_BACKFILL_PERIOD")
+    WORKFLOW_SOFT_TIME_LIMIT: int = Field(600, env="WORKFLOW_SOFT_TIME_LIMIT")
+    WORKFLOW_TIME_LIMIT: int = Field(720, env="WORKFLOW_TIME_LIMIT")
+    WORKFLOW_LARGE_SOFT_TIME_LIMIT: int = Field(3600, env="WORKFLOW_LARGE_SOFT_TIME_LIMIT")
+    WORKFLOW_LARGE_TIME_LIMIT: int = Field(3900, env="WORKFLOW_LARGE_TIME_LIMIT")
+    WORKFLOW_LOCK_RETRY_DELAY: int = Field(30, env="WORKFLOW_LOCK_RETRY_DELAY")
+    WORKFLOW_LOCK_MAX_RETRIES: int = Field(240, env="WORKFLOW_LOCK_MAX_RETRIES")
+    WORKFLOW_INCOMPLETE_RETRY_DELAY: int = Field(60, env="WORKFLOW_INCOMPLETE_RETRY_DELAY")
+    WORKFLOW_INCOMPLETE_MAX_RETRIES: int = Field(3, env="WORKFLOW_INCOMPLETE_MAX_RETRIES")
+    X_RATE_LIMIT_MAX_WAIT: int = Field(60, env="X_RATE_LIMIT_MAX_WAIT")
+    X_RATE_LIMIT_MAX_RETRIES: int = Field(5, env="X_RATE_LIMIT_MAX_RETRIES")
+    PROGRESS_INTERVAL: float = Field(0.5, env="PROGRESS_INTERVAL")
+    TASK_PROGRESS_BATCH_SIZE: int = Field(50, env="TASK_PROGRESS_BATCH_SIZE")
+    FETCH_CHECKPOINTS_ENABLED: bool = Field(True, env="FETCH_CHECKPOINTS_ENABLED")
+    DEDUP_ENABLED: bool = Field(True, env="DEDUP_ENABLED")
+    DEDUP_THRESHOLD: float = Field(0.8, env="DEDUP_THRESHOLD")
+    DEDUP_INDEX_TTL: int = Field(30 * 24 * 3600, env="DEDUP_INDEX_TTL")
+    GEMINI_BATCH_SIZE: int = Field(10, env="GEMINI_BATCH_SIZE")
+    GEMINI_CONCURRENCY: int = Field(4, env="GEMINI_CONCURRENCY")
+    CLASSIFICATION_CACHE_ENABLED: bool = Field(True, env="CLASSIFICATION_CACHE_ENABLED")
+    CLASSIFICATION_CACHE_TTL: int = Field(7 * 24 * 3600, env="CLASSIFICATION_CACHE_TTL")
+    CLASSIFICATION_CACHE_MAX_ENTRIES: int = Field(100_000, env="CLASSIFICATION_CACHE_MAX_ENTRIES")
+    TRELLO_CONCURRENCY: int = Field(4, env="TRELLO_CONCURRENCY")
+    TRELLO_QUEUE_SIZE: int = Field(20, env="TRELLO_QUEUE_SIZE")
+    TRELLO_DESTINATION_TTL: int = Field(3600, env="TRELLO_DESTINATION_TTL")
+    TRELLO_POOL_SIZE: int = Field(10, env="TRELLO_POOL_SIZE")
+    TRELLO_TIMEOUT: float = Field(10.0, env="TRELLO_TIMEOUT")
+    TRELLO_MAX_RETRIES: int = Field(3, env="TRELLO_MAX_RETRIES")
+    TRELLO_KEY_REQUESTS_PER_10S: int = Field(300, env="TRELLO_KEY_REQUESTS_PER_10S")
+    TRELLO_TOKEN_REQUESTS_PER_10S: int = Field(100, env="TRELLO_TOKEN_REQUESTS_PER_10S")
+    CARD_LEDGER_ENABLED: bool = Field(True, env="CARD_LEDGER_ENABLED")
+    CARD_LEDGER_LEASE: int = Field(300, env="CARD_LEDGER_LEASE")
+    CARD_LEDGER_TTL: int = Field(30 * 24 * 3600, env="CARD_LEDGER_TTL")
+    PREFILTER_ENABLED: bool = Field(True, env="PREFILTER_ENABLED")
+    PREFILTER_LANGUAGES: str = Field("en", env="PREFILTER_LANGUAGES")
+    PREFILTER_SPAM_MIN_TAGS: int = Field(5, env="PREFILTER_SPAM_MIN_TAGS")
+    PREFILTER_CLASSIFIER_ENABLED: bool = Field(True, env="PREFILTER_CLASSIFIER_ENABLED")
+    PREFILTER_REJECT_BELOW: float = Field(0.05, env="PREFILTER_REJECT_BELOW")
+    PREFILTER_MAX_MISSED: float = Field(0.02, env="PREFILTER_MAX_MISSED")
+    PREFILTER_MIN_TRAINING_SAMPLES: int = Field(500, env="PREFILTER_MIN_TRAINING_SAMPLES")
+    PREFILTER_TRAINING_LIMIT: int = Field(20_000, env="PREFILTER_TRAINING_LIMIT")
+    PREFILTER_RETRAIN_INTERVAL: int = Field(24 * 3600, env="PREFILTER_RETRAIN_INTERVAL")
+    FETCH_COALESCE_ENABLED: bool = Field(True, env="FETCH_COALESCE_ENABLED")
+    FETCH_COALESCE_WINDOW: float = Field(2.0, env="FETCH_COALESCE_WINDOW")
+    FETCH_SHARE_TTL: int = Field(60, env="FETCH_SHARE_TTL")
+    FETCH_SHARE_MAX_TWEETS: int = Field(200, env="FETCH_SHARE_MAX_TWEETS")
+    FETCH_WAIT_TIMEOUT: int = Field(300, env="FETCH_WAIT_TIMEOUT")
+    X_MAX_QUERY_LENGTH: int = Field(512, env="X_MAX_QUERY_LENGTH")
+    X_API_URL: str = Field("https://api.twitter.com", env="X_API_URL")
+    GEMINI_API_ENDPOINT: Optional[str] = Field(None, env="GEMINI_API_ENDPOINT")
+    TRELLO_API_URL: str = Field("https://api.trello.com/1", env="TRELLO_API_URL")
 
     class Config:
         env_file = '.env'
@@ -1,6 +1,49 @@
 # app/database.py
-from pymongo import MongoClient
+import os
+import threading
+from pymongo import AsyncMongoClient, MongoClient
 from app.core.config import settings
 
-client = MongoClient(settings.MONGODB_URI)
-db = client[settings.MONGODB_DB_NAME]
\ No newline at end of file
+_client = None
+_client_lock = threading.Lock()
+_async_client = None
+
+def _reset_client():
+    # MongoClient is not fork-safe; a child forked after get_db() opens its own.
+    global _client, _client_lock
+    _client = None
+    _client_lock = threading.Lock()
+
+os.register_at_fork(after_in_child=_reset_client)
+
+def get_db():
+    """
+    Return the synchronous database used by Celery workers and the pipeline.
+
+    The client is created on first use rather than at import, so it is opened in each
+    worker process after Celery forks.
+    """
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = MongoClient(settings.MONGODB_URI)
+    return _client[settings.MONGODB_DB_NAME]
+
+async def connect_async_db():
+    """Open the API's non-blocking Mongo client. Called from the FastAPI lifespan on startup."""
+    global _async_client
+    _async_client = AsyncMongoClient(settings.MONGODB_URI)
+
+async def close_async_db():
+    """Close the API's Mongo client. Called from the FastAPI lifespan on shutdown."""
+    global _async_client
+    if _async_client is not None:
+        await _async_client.close()
+        _async_client = None
+
+def get_async_db():
+    """FastAPI dependency returning the API's non-blocking database."""
+    if _async_client is None:
+        raise RuntimeError("The async Mongo client is not connected; is the app lifespan running?")
+    return _async_client[settings.MONGODB_DB_NAME]
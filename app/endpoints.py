@@ -1,37 +1,172 @@
-from datetime import datetime
-from fastapi import APIRouter, HTTPException
-from app.database import db
-from app.tasks.workflow_tasks import execute_workflow_task
-from app.models import WorkflowRequest, TaskResponse
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
+from app.database import get_async_db
+from app.tasks.workflow_tasks import execute_workflow_task, workflow_options
+from app.models import BatchResponse, BatchStatusResponse, BatchWorkflowRequest, WorkflowRequest, TaskListResponse, TaskResponse
+from app.repositories import tasks as task_repository
+from app.repositories.tasks import TERMINAL_STATUSES
+from app.services.x import quota_usage
+from app.utils.events import task_channel
+from app.utils.redis_utils import get_async_redis
+from celery import group
+import asyncio
+import json
 import uuid
 
 router = APIRouter()
 
 @router.post("/workflows", response_model=TaskResponse)
-async def create_workflow(request: WorkflowRequest):
+async def create_workflow(request: WorkflowRequest, db=Depends(get_async_db)):
     task_id = str(uuid.uuid4())
     
     # Create initial task document
-    db.tasks.insert_one({
-        "_id": task_id,
-        "status": "PENDING",
-        "params": request.dict(),
-        "created_at": datetime.utcnow()
-    })
+    await task_repository.insert_task(db, task_id, request.dict())
     
-    # Start Celery task
-    execute_workflow_task.apply_async(
+    # Start Celery task; publishing to the broker blocks, so keep it off the event loop
+    await run_in_threadpool(
+        execute_workflow_task.apply_async,
         args=[request.dict()],
-        task_id=task_id
+        task_id=task_id,
+        # Queue and time limits by expected size
+        **workflow_options(request.dict())
     )
     
     return {"task_id": task_id, "status": "PENDING"}
 
+@router.post("/workflows/batch", response_model=BatchResponse)
+async def create_workflow_batch(request: BatchWorkflowRequest, db=Depends(get_async_db)):
+    """Submit many workflows at once: one insert_many, one batch document and one Celery group."""
+    batch_id = str(uuid.uuid4())
+    tasks = [
+        (str(uuid.uuid4()), workflow.dict())
+        for workflow in request.workflows
+    ]
+    await task_repository.insert_tasks(db, tasks, batch_id)
+
+    # Publish the whole group over one broker connection, off the event loop
+    batch = group(
+        execute_workflow_task.s(params).set(task_id=task_id, **workflow_options(params))
+        for task_id, params in tasks
+    )
+    await run_in_threadpool(batch.apply_async)
+
+    return {"batch_id": batch_id, "task_ids": [task_id for task_id, _ in tasks], "status": "PENDING"}
+
+@router.get("/workflows/batches/{batch_id}", response_model=BatchStatusResponse)
+async def get_workflow_batch_status(batch_id: str, db=Depends(get_async_db)):
+    """Aggregate status of a batch: task counts per status and an overall status."""
+    if not await task_repository.batch_exists(db, batch_id):
+        raise HTTPException(status_code=404, detail="Batch not found")
+
+    counts = await task_repository.count_batch_statuses(db, batch_id)
+    total = sum(counts.values())
+
+    finished = sum(counts.get(status, 0) for status in TERMINAL_STATUSES)
+    if finished < total:
+        status = "PENDING" if counts.get("PENDING", 0) == total else "RUNNING"
+    elif counts.get("FAILED"):
+        status = "COMPLETED_WITH_ERRORS" if counts.get("COMPLETED") else "FAILED"
+    else:
+        status = "COMPLETED"
+
+    return {"batch_id": batch_id, "status": status, "total": total, "counts": counts}
+
+@router.get("/workflows", response_model=TaskListResponse)
+async def list_workflows(
+    status: str = None,
+    product_name: str = None,
+    limit: int = Query(20, ge=1, le=100),
+    cursor: str = None,
+    db=Depends(get_async_db)
+):
+    """Task summaries, newest first. Pass the returned next_cursor to get the following page."""
+    try:
+        tasks, next_cursor = await task_repository.list_tasks(db, status, product_name, limit, cursor)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    for task in tasks:
+        task["task_id"] = task.pop("_id")
+    return {"tasks": tasks, "next_cursor": next_cursor}
+
 @router.get("/workflows/{task_id}", response_model=TaskResponse)
-async def get_workflow_status(task_id: str):
-    task = db.tasks.find_one({"_id": task_id})
+async def get_workflow_status(task_id: str, db=Depends(get_async_db)):
+    task = await task_repository.get_task_status(db, task_id)
     if not task:
         raise HTTPException(status_code=404, detail="Task not found")
     task["_id"] = str(task["_id"])
     task["task_id"] = task.pop("_id")
-    return task
\ No newline at end of file
+    return task
+
+# Seconds between keep-alive comments on an idle event stream, and between
+# Mongo polls when Redis is not configured.
+EVENT_KEEPALIVE = 15
+EVENT_POLL_INTERVAL = 1
+
+def sse(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+def task_status_event(task: dict) -> dict:
+    return {key: task[key] for key in ("status", "result", "error") if key in task}
+
+async def redis_task_events(task_id: str, db, redis_client):
+    pubsub = redis_client.pubsub()
+    # Subscribe before reading the current status so no transition falls in between.
+    await pubsub.subscribe(task_channel(task_id))
+    try:
+        task = await task_repository.get_task_status(db, task_id)
+        yield sse("status", task_status_event(task))
+        if task["status"] in TERMINAL_STATUSES:
+            return
+        while True:
+            message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=EVENT_KEEPALIVE)
+            if message is None:
+                yield ": keep-alive\n\n"
+                continue
+            payload = json.loads(message["data"])
+            yield sse(payload["event"], payload["data"])
+            if payload["event"] == "status" and payload["data"].get("status") in TERMINAL_STATUSES:
+                return
+    finally:
+        await pubsub.unsubscribe()
+        await pubsub.aclose()
+
+async def polled_task_events(task_id: str, db):
+    last = None
+    idle = 0
+    while True:
+        task = await task_repository.get_task_status(db, task_id)
+        event = task_status_event(task)
+        if event != last:
+            yield sse("status", event)
+            last = event
+            idle = 0
+        elif idle >= EVENT_KEEPALIVE:
+            yield ": keep-alive\n\n"
+            idle = 0
+        if event["status"] in TERMINAL_STATUSES:
+            return
+        await asyncio.sleep(EVENT_POLL_INTERVAL)
+        idle += EVENT_POLL_INTERVAL
+
+@router.get("/workflows/{task_id}/events")
+async def stream_workflow_events(task_id: str, db=Depends(get_async_db)):
+    """
+    Server-sent events for a task: a "status" event on every status transition and
+    "metrics" events with live per-stage counts while it runs. The stream ends once
+    the task is COMPLETED or FAILED.
+    """
+    if not await task_repository.task_exists(db, task_id):
+        raise HTTPException(status_code=404, detail="Task not found")
+    redis_client = get_async_redis()
+    if redis_client is not None:
+        events = redis_task_events(task_id, db, redis_client)
+    else:
+        # Without Redis there is no push channel; fall back to watching the task document.
+        events = polled_task_events(task_id, db)
+    return StreamingResponse(events, media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+@router.get("/rate-limits/x")
+def get_x_rate_limits():
+    """Current X API budget per route, as last reported by X and shared by all workers."""
+    return {"quotas": quota_usage()}
@@ -1,11 +1,32 @@
+from contextlib import asynccontextmanager
+import logging
 from fastapi import FastAPI
+from fastapi.responses import PlainTextResponse
+from app.database import close_async_db, connect_async_db, get_async_db
 from app.endpoints import router as workflow_router
+from app.repositories.tasks import ensure_indexes
+from app.utils.redis_utils import close_async_redis
+from app.utils.telemetry import render
 from fastapi.middleware.cors import CORSMiddleware
 
+logger = logging.getLogger(__name__)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await connect_async_db()
+    try:
+        await ensure_indexes(get_async_db())
+    except Exception as e:
+        logger.error(f"Failed to create task indexes: {e}")
+    yield
+    await close_async_db()
+    await close_async_redis()
+
 app = FastAPI(
     title="Product Management Assistant",
     description="API for processing tweets and creating Trello cards",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 app.add_middleware(
@@ -16,4 +37,9 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-app.include_router(workflow_router, prefix="/api/v1")
\ No newline at end of file
+app.include_router(workflow_router, prefix="/api/v1")
+
+@app.get("/metrics", response_class=PlainTextResponse, include_in_schema=False)
+def metrics():
+    """Prometheus scrape endpoint covering the API process and, with Redis, every worker."""
+    return PlainTextResponse(render(), media_type="text/plain; version=0.0.4")
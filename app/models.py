@@ -1,4 +1,5 @@
-from pydantic import BaseModel
+from datetime import datetime
+from pydantic import BaseModel, Field
 from typing import Optional
 
 class Metrics(BaseModel):
@@ -7,6 +8,13 @@ class Metrics(BaseModel):
     cards_added: int
     classification_errors: int
     trello_errors: int
+    classification_cache_hits: int = 0
+    classification_cache_misses: int = 0
+    duplicates_merged: int = 0
+    prefiltered_tweets: int = 0
+    duplicate_cards_skipped: int = 0
+    resumed_tweets: int = 0
+    skipped_tweets: int = 0
 
 class WorkflowRequest(BaseModel):
     product_name: str
@@ -26,8 +34,37 @@ class WorkflowResponse(BaseModel):
     stage: Optional[str] = None
     metrics: Metrics
     message: Optional[str] = None
+    timings: dict[str, float] = {}
 
 class TaskResponse(BaseModel):
     task_id: str
     status: str
-    result: WorkflowResponse | dict | None = None
\ No newline at end of file
+    result: WorkflowResponse | dict | None = None
+    error: Optional[str] = None
+
+class TaskSummary(BaseModel):
+    task_id: str
+    status: str
+    product_name: Optional[str] = None
+    batch_id: Optional[str] = None
+    created_at: Optional[datetime] = None
+    started_at: Optional[datetime] = None
+    completed_at: Optional[datetime] = None
+
+class TaskListResponse(BaseModel):
+    tasks: list[TaskSummary]
+    next_cursor: Optional[str] = None
+
+class BatchWorkflowRequest(BaseModel):
+    workflows: list[WorkflowRequest] = Field(..., min_length=1, max_length=1000)
+
+class BatchResponse(BaseModel):
+    batch_id: str
+    task_ids: list[str]
+    status: str
+
+class BatchStatusResponse(BaseModel):
+    batch_id: str
+    status: str
+    total: int
+    counts: dict[str, int]
@@ -0,0 +1,137 @@
+from datetime import datetime, timedelta
+from pymongo import ASCENDING, DESCENDING
+from app.core.config import settings
+
+TERMINAL_STATUSES = ("COMPLETED", "FAILED")
+
+# Credentials are handed to the Celery task directly and never stored on task documents.
+SECRET_PARAMS = {"trello_api_key", "trello_token"}
+
+# Status reads skip params, per-tweet progress and any other bulky fields.
+STATUS_PROJECTION = {"status": 1, "result": 1, "error": 1}
+SUMMARY_PROJECTION = {
+    "status": 1,
+    "product_name": 1,
+    "batch_id": 1,
+    "created_at": 1,
+    "started_at": 1,
+    "completed_at": 1,
+}
+
+async def ensure_indexes(db):
+    """Create the task collection indexes. Called once from the API lifespan on startup."""
+    await db.tasks.create_index([("created_at", DESCENDING), ("_id", DESCENDING)], name="created_at")
+    await db.tasks.create_index([("status", ASCENDING), ("created_at", DESCENDING), ("_id", DESCENDING)], name="status_created_at")
+    await db.tasks.create_index([("product_name", ASCENDING), ("created_at", DESCENDING), ("_id", DESCENDING)], name="product_name_created_at")
+    await db.tasks.create_index([("batch_id", ASCENDING), ("status", ASCENDING)], name="batch_id_status", sparse=True)
+    # Finished tasks get an expires_at; Mongo removes them once it has passed.
+    await db.tasks.create_index([("expires_at", ASCENDING)], name="expires_at_ttl", expireAfterSeconds=0)
+
+def task_document(task_id: str, params: dict, created_at: datetime, batch_id: str = None) -> dict:
+    document = {
+        "_id": task_id,
+        "status": "PENDING",
+        "product_name": params.get("product_name"),
+        "params": {key: value for key, value in params.items() if key not in SECRET_PARAMS},
+        "created_at": created_at
+    }
+    if batch_id:
+        document["batch_id"] = batch_id
+    return document
+
+async def insert_task(db, task_id: str, params: dict):
+    await db.tasks.insert_one(task_document(task_id, params, datetime.utcnow()))
+
+async def insert_tasks(db, tasks: list, batch_id: str):
+    """Insert (task_id, params) pairs of one batch, and the batch itself, in two round trips."""
+    created_at = datetime.utcnow()
+    await db.tasks.insert_many(
+        [task_document(task_id, params, created_at, batch_id) for task_id, params in tasks],
+        ordered=False
+    )
+    await db.batches.insert_one({
+        "_id": batch_id,
+        "task_ids": [task_id for task_id, _ in tasks],
+        "created_at": created_at
+    })
+
+async def get_task_status(db, task_id: str):
+    return await db.tasks.find_one({"_id": task_id}, STATUS_PROJECTION)
+
+async def task_exists(db, task_id: str) -> bool:
+    return await db.tasks.find_one({"_id": task_id}, {"_id": 1}) is not None
+
+async def batch_exists(db, batch_id: str) -> bool:
+    return await db.batches.find_one({"_id": batch_id}, {"_id": 1}) is not None
+
+async def count_batch_statuses(db, batch_id: str) -> dict:
+    cursor = await db.tasks.aggregate([
+        {"$match": {"batch_id": batch_id}},
+        {"$group": {"_id": "$status", "count": {"$sum": 1}}}
+    ])
+    return {group["_id"]: group["count"] async for group in cursor}
+
+def encode_cursor(task: dict) -> str:
+    return f"{task['created_at'].isoformat()}|{task['_id']}"
+
+def decode_cursor(cursor: str):
+    """
+    Raises:
+        ValueError: If the cursor was not produced by encode_cursor.
+    """
+    created_at, task_id = cursor.split("|", 1)
+    return datetime.fromisoformat(created_at), task_id
+
+async def list_tasks(db, status: str = None, product_name: str = None, limit: int = 20, cursor: str = None):
+    """
+    List task summaries, newest first, with keyset pagination.
+
+    Returns:
+        tuple: (tasks, next_cursor). next_cursor is None on the last page.
+    """
+    query = {}
+    if status:
+        query["status"] = status
+    if product_name:
+        query["product_name"] = product_name
+    if cursor:
+        created_at, task_id = decode_cursor(cursor)
+        query["$or"] = [
+            {"created_at": {"$lt": created_at}},
+            {"created_at": created_at, "_id": {"$lt": task_id}}
+        ]
+
+    tasks = await db.tasks.find(query, SUMMARY_PROJECTION) \
+        .sort([("created_at", DESCENDING), ("_id", DESCENDING)]) \
+        .limit(limit + 1) \
+        .to_list(length=limit + 1)
+    next_cursor = encode_cursor(tasks[limit - 1]) if len(tasks) > limit else None
+    return tasks[:limit], next_cursor
+
+def update_task_status(db, task_id: str, status: str, **fields):
+    """
+    Set a task's status from a worker. Finished tasks are given an expires_at
+    TASK_RETENTION_DAYS ahead, after which the TTL index removes them.
+    """
+    update = {"status": status, "updated_at": datetime.utcnow(), **fields}
+    if status in TERMINAL_STATUSES:
+        update["expires_at"] = datetime.utcnow() + timedelta(days=settings.TASK_RETENTION_DAYS)
+    operation = {"$set": update}
+    if status == "COMPLETED":
+        # A completed run is never resumed, so its progress is no longer needed.
+        operation["$unset"] = {"progress": ""}
+    db.tasks.update_one({"_id": task_id}, operation)
+
+def get_task_progress(db, task_id: str) -> dict:
+    """Return the per-tweet progress saved by earlier attempts of a task, keyed by tweet id."""
+    task = db.tasks.find_one({"_id": task_id}, {"progress": 1})
+    return (task or {}).get("progress") or {}
+
+def save_task_progress(db, task_id: str, entries: dict):
+    """Store per-tweet progress entries, keyed by tweet id, on the task document in one update."""
+    if not entries:
+        return
+    db.tasks.update_one(
+        {"_id": task_id},
+        {"$set": {f"progress.{tweet_id}": entry for tweet_id, entry in entries.items()}}
+    )
@@ -0,0 +1,121 @@
+import hashlib
+import logging
+import uuid
+from datetime import datetime, timedelta
+from pymongo import ASCENDING, ReturnDocument
+from pymongo.errors import DuplicateKeyError, OperationFailure
+from app.core.config import settings
+from app.database import get_db
+from app.services.dedup import normalize
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+PENDING = "PENDING"
+CREATED = "CREATED"
+
+# Fields of Trello's card response kept with a CREATED entry and returned for duplicates.
+CARD_FIELDS = ("id", "name", "idList", "shortUrl", "url")
+
+_indexes_ready = False
+
+def get_collection():
+    return get_db().card_ledger
+
+def ensure_indexes():
+    """Create the TTL index that expires entries CARD_LEDGER_TTL seconds after they were reserved."""
+    global _indexes_ready
+    if _indexes_ready:
+        return
+    collection = get_collection()
+    try:
+        collection.create_index(
+            [("reserved_at", ASCENDING)],
+            name="reserved_at_ttl",
+            expireAfterSeconds=settings.CARD_LEDGER_TTL,
+        )
+    except OperationFailure:
+        # The index exists with a different TTL; update it in place.
+        get_db().command(
+            "collMod",
+            collection.name,
+            index={"name": "reserved_at_ttl", "expireAfterSeconds": settings.CARD_LEDGER_TTL},
+        )
+    _indexes_ready = True
+
+def source_key(tweet: dict) -> str:
+    """Identify the tweet a card comes from: its id, or a hash of its normalized text when it has none."""
+    if tweet.get("id"):
+        return f"tweet:{tweet['id']}"
+    return "text:" + hashlib.sha256(normalize(tweet.get("text") or "").encode()).hexdigest()
+
+def ledger_key(destination: str, source: str) -> str:
+    """Key of the entry for one source in one destination, the resolved "board_id:list_id"."""
+    return hashlib.sha256(f"{destination}|{source}".encode()).hexdigest()
+
+def reserve(key: str):
+    """
+    Atomically claim the right to create the card for key.
+
+    The first caller inserts a PENDING entry holding a lease of CARD_LEDGER_LEASE seconds.
+    Later callers are refused while it is pending, and get the stored card once it is
+    CREATED. A pending entry whose lease ran out, because its writer died mid-way, is
+    taken over.
+
+    Returns:
+        dict: {"reserved": True, "owner": str} for the caller that should create the card,
+              {"reserved": False, "card": dict or None} otherwise, or None when the ledger
+              is unavailable.
+    """
+    now = datetime.utcnow()
+    owner = uuid.uuid4().hex
+    lease_until = now + timedelta(seconds=settings.CARD_LEDGER_LEASE)
+    try:
+        ensure_indexes()
+        try:
+            existing = get_collection().find_one_and_update(
+                {"_id": key},
+                {"$setOnInsert": {"status": PENDING, "owner": owner, "lease_until": lease_until, "reserved_at": now}},
+                upsert=True,
+                return_document=ReturnDocument.BEFORE,
+            )
+        except DuplicateKeyError:
+            # A concurrent upsert inserted the entry first.
+            existing = get_collection().find_one({"_id": key})
+        if existing is None:
+            return {"reserved": True, "owner": owner}
+        if existing["status"] == CREATED:
+            return {"reserved": False, "card": existing.get("card")}
+
+        taken = get_collection().find_one_and_update(
+            {"_id": key, "status": PENDING, "lease_until": {"$lt": now}},
+            {"$set": {"owner": owner, "lease_until": lease_until}},
+        )
+        if taken is not None:
+            logger.warning(f"Took over card reservation {key} after its lease expired.")
+            return {"reserved": True, "owner": owner}
+        return {"reserved": False, "card": None}
+    except Exception as e:
+        logger.warning(f"Card ledger unavailable, creating the card without it: {e}")
+        return None
+
+def mark_created(key: str, owner: str, card: dict):
+    """Record the card created under the caller's reservation."""
+    try:
+        get_collection().update_one(
+            {"_id": key, "owner": owner},
+            {"$set": {
+                "status": CREATED,
+                "card": {field: card.get(field) for field in CARD_FIELDS if field in card},
+                "created_at": datetime.utcnow(),
+            }, "$unset": {"lease_until": ""}},
+        )
+    except Exception as e:
+        logger.warning(f"Failed to record created card {card.get('id')} in the card ledger: {e}")
+
+def release(key: str, owner: str):
+    """Drop the caller's pending reservation after a failure that created no card, so a retry can create it."""
+    try:
+        get_collection().delete_one({"_id": key, "owner": owner, "status": PENDING})
+    except Exception as e:
+        logger.warning(f"Failed to release card reservation {key}: {e}")
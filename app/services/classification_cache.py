@@ -0,0 +1,111 @@
+import hashlib
+import json
+import logging
+from datetime import datetime
+from pymongo import ASCENDING, DESCENDING
+from pymongo.errors import OperationFailure
+from app.core.config import settings
+from app.database import get_db
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+_indexes_ready = False
+
+def get_collection():
+    return get_db().classification_cache
+
+def cache_key(x_post: dict, prioritization_rule, product_description: str, model_name: str, prompt_version: str) -> str:
+    """
+    Hash of everything that determines a classification: tweet text, product, rules, model,
+    and the version of the prompt and generation settings.
+    """
+    payload = json.dumps(
+        [x_post.get("text", ""), product_description, prioritization_rule, model_name, prompt_version],
+        sort_keys=True,
+        default=str,
+    )
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+def ensure_indexes():
+    """
+    Create the TTL index that expires entries CLASSIFICATION_CACHE_TTL seconds after they
+    were stored, and the index the prefilter reads a product's latest decisions with.
+    """
+    global _indexes_ready
+    if _indexes_ready:
+        return
+    collection = get_collection()
+    try:
+        collection.create_index(
+            [("created_at", ASCENDING)],
+            name="created_at_ttl",
+            expireAfterSeconds=settings.CLASSIFICATION_CACHE_TTL,
+        )
+    except OperationFailure:
+        # The index exists with a different TTL; update it in place.
+        get_db().command(
+            "collMod",
+            collection.name,
+            index={"name": "created_at_ttl", "expireAfterSeconds": settings.CLASSIFICATION_CACHE_TTL},
+        )
+    collection.create_index([("product_name", ASCENDING), ("created_at", DESCENDING)], name="product_recent")
+    _indexes_ready = True
+
+def get_cached(keys: list) -> dict:
+    """
+    Look up cached classifications.
+
+    Returns:
+        dict: Maps each key found in the cache to its post_to_card style result.
+    """
+    if not keys:
+        return {}
+    try:
+        ensure_indexes()
+        return {doc["_id"]: doc["result"] for doc in get_collection().find({"_id": {"$in": keys}}, {"result": 1})}
+    except Exception as e:
+        logger.warning(f"Classification cache lookup failed: {e}")
+        return {}
+
+def store(results: dict, x_posts: dict = None, product_name: str = None):
+    """
+    Cache successful classifications and evict the oldest entries beyond CLASSIFICATION_CACHE_MAX_ENTRIES.
+
+    Parameters:
+        results (dict): Maps cache keys to post_to_card style results. Failed results are not cached.
+        x_posts (dict, optional): Maps cache keys to the classified tweets. Their text is kept
+            with the result, together with product_name, to train the prefilter on.
+        product_name (str, optional): The product the tweets were classified for.
+    """
+    now = datetime.utcnow()
+    x_posts = x_posts or {}
+    documents = []
+    for key, result in results.items():
+        if not result.get("success"):
+            continue
+        document = {"_id": key, "result": result, "created_at": now}
+        if key in x_posts:
+            document["text"] = x_posts[key].get("text", "")
+            document["product_name"] = product_name
+        documents.append(document)
+    if not documents:
+        return
+    try:
+        ensure_indexes()
+        get_collection().insert_many(documents, ordered=False)
+    except Exception as e:
+        # Duplicate keys from concurrent runs are expected; anything else is only logged.
+        if "E11000" not in str(e):
+            logger.warning(f"Classification cache write failed: {e}")
+    _evict()
+
+def _evict():
+    try:
+        excess = get_collection().estimated_document_count() - settings.CLASSIFICATION_CACHE_MAX_ENTRIES
+        if excess <= 0:
+            return
+        oldest = [doc["_id"] for doc in get_collection().find({}, {"_id": 1}).sort("created_at", ASCENDING).limit(excess)]
+        get_collection().delete_many({"_id": {"$in": oldest}})
+    except Exception as e:
+        logger.warning(f"Classification cache eviction failed: {e}")
@@ -0,0 +1,244 @@
+import hashlib
+import logging
+import random
+import re
+from datetime import datetime
+from pymongo import ASCENDING, UpdateOne
+from pymongo.errors import OperationFailure
+from app.core.config import settings
+from app.database import get_db
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+_indexes_ready = False
+
+def get_collection():
+    return get_db().dedup_index
+
+# 16 bands of 4 rows: tweets with a Jaccard similarity of 0.8 share a band with
+# probability > 0.999, while unrelated tweets almost never do.
+NUM_BANDS = 16
+ROWS_PER_BAND = 4
+NUM_PERM = NUM_BANDS * ROWS_PER_BAND
+SHINGLE_SIZE = 3
+ENGAGEMENT_FIELDS = ("likes", "retweets", "replies")
+
+_MERSENNE_PRIME = (1 << 61) - 1
+_rng = random.Random(1)
+_PERMUTATIONS = [
+    (_rng.randrange(1, _MERSENNE_PRIME), _rng.randrange(0, _MERSENNE_PRIME))
+    for _ in range(NUM_PERM)
+]
+
+_RETWEET_PREFIX = re.compile(r"^rt\s+@\w+:?\s*")
+_URL = re.compile(r"https?://\S+")
+_MENTION = re.compile(r"@\w+")
+_NON_WORD = re.compile(r"[^\w\s]+")
+_SPACES = re.compile(r"\s+")
+
+def normalize(text: str) -> str:
+    """Lowercase and drop retweet prefixes, links, mentions and punctuation."""
+    text = _RETWEET_PREFIX.sub("", text.lower().strip())
+    text = _URL.sub(" ", text)
+    text = _MENTION.sub(" ", text)
+    text = _NON_WORD.sub(" ", text)
+    return _SPACES.sub(" ", text).strip()
+
+def shingles(normalized: str) -> set:
+    words = normalized.split()
+    if len(words) <= SHINGLE_SIZE:
+        return {normalized}
+    return {" ".join(words[i:i + SHINGLE_SIZE]) for i in range(len(words) - SHINGLE_SIZE + 1)}
+
+def _hash64(value: str) -> int:
+    return int.from_bytes(hashlib.blake2b(value.encode(), digest_size=8).digest(), "big")
+
+def minhash(shingle_set: set) -> list:
+    hashes = [_hash64(shingle) for shingle in shingle_set]
+    return [min((a * h + b) % _MERSENNE_PRIME for h in hashes) for a, b in _PERMUTATIONS]
+
+def lsh_bands(signature: list) -> list:
+    bands = []
+    for band in range(NUM_BANDS):
+        rows = signature[band * ROWS_PER_BAND:(band + 1) * ROWS_PER_BAND]
+        digest = hashlib.blake2b(repr(rows).encode(), digest_size=8).hexdigest()
+        bands.append(f"{band}:{digest}")
+    return bands
+
+def similarity(signature: list, other: list) -> float:
+    """Estimated Jaccard similarity of the shingle sets behind two signatures."""
+    return sum(1 for a, b in zip(signature, other) if a == b) / NUM_PERM
+
+def _engagement(tweet: dict, field: str) -> int:
+    value = tweet.get(field, 0)
+    return value if isinstance(value, int) else 0
+
+def ensure_indexes():
+    global _indexes_ready
+    if _indexes_ready:
+        return
+    collection = get_collection()
+    collection.create_index([("product", ASCENDING), ("bands", ASCENDING)], name="product_bands")
+    try:
+        collection.create_index(
+            [("created_at", ASCENDING)],
+            name="created_at_ttl",
+            expireAfterSeconds=settings.DEDUP_INDEX_TTL,
+        )
+    except OperationFailure:
+        get_db().command(
+            "collMod",
+            collection.name,
+            index={"name": "created_at_ttl", "expireAfterSeconds": settings.DEDUP_INDEX_TTL},
+        )
+    _indexes_ready = True
+
+class DedupIndex:
+    """
+    Near-duplicate detector for one product's tweets, over one run and the runs before it.
+
+    Tweets are compared by MinHash signatures of their normalized word shingles, with LSH
+    bands used to find candidates. Within a run, a duplicate is merged into the first tweet
+    like it: its likes, retweets and replies are added to that tweet's. A tweet matching one
+    recorded by an earlier run is dropped, since it already went through the pipeline; when
+    it is that very tweet fetched again, nothing is added to the record. The run's new
+    tweets are only recorded once commit() is called.
+    """
+
+    def __init__(self, product_name: str, threshold: float = None):
+        self.product_name = product_name
+        self.threshold = settings.DEDUP_THRESHOLD if threshold is None else threshold
+        self.merged = 0
+        self._representatives = []
+        self._buckets = {}
+        self._seen_before = {}
+
+    def _find_in_run(self, signature: list, bands: list):
+        for band in bands:
+            for entry in self._buckets.get(band, ()):
+                if similarity(signature, entry["signature"]) >= self.threshold:
+                    return entry
+        return None
+
+    def _find_in_index(self, candidates: list) -> dict:
+        """Map the position of each candidate to the matching index document from earlier runs."""
+        all_bands = sorted({band for _, _, bands in candidates for band in bands})
+        if not all_bands:
+            return {}
+        try:
+            ensure_indexes()
+            documents = list(get_collection().find(
+                {"product": self.product_name, "bands": {"$in": all_bands}},
+                {"signature": 1, "bands": 1, "tweet_id": 1},
+            ))
+        except Exception as e:
+            logger.warning(f"Dedup index lookup failed, only deduplicating within the run: {e}")
+            return {}
+
+        by_band = {}
+        for document in documents:
+            for band in document["bands"]:
+                by_band.setdefault(band, []).append(document)
+        matches = {}
+        for position, (signature, _, bands) in enumerate(candidates):
+            for band in bands:
+                match = next(
+                    (doc for doc in by_band.get(band, ()) if similarity(signature, doc["signature"]) >= self.threshold),
+                    None,
+                )
+                if match:
+                    matches[position] = match
+                    break
+        return matches
+
+    def filter_page(self, tweets: list) -> list:
+        """
+        Return the tweets of a page that are not duplicates, in their original order.
+
+        Duplicates of tweets kept earlier in the run are merged into them, so tweets
+        returned from this page carry the engagement of their duplicates on the same page.
+        """
+        unique = []
+        candidates = []
+        for tweet in tweets:
+            signature = minhash(shingles(normalize(tweet.get("text", ""))))
+            bands = lsh_bands(signature)
+            entry = self._find_in_run(signature, bands)
+            if entry:
+                self._merge(entry, tweet)
+                continue
+            entry = {"tweet": tweet, "signature": signature, "bands": bands, "duplicates": 0, "merged": dict.fromkeys(ENGAGEMENT_FIELDS, 0)}
+            self._representatives.append(entry)
+            for band in bands:
+                self._buckets.setdefault(band, []).append(entry)
+            candidates.append((signature, tweet, bands))
+            unique.append(entry)
+
+        earlier = self._find_in_index(candidates)
+        kept = []
+        for position, entry in enumerate(unique):
+            match = earlier.get(position)
+            if match:
+                # Already handled by an earlier run; later duplicates in this run fold into it too.
+                entry["previous_id"] = match["_id"]
+                if entry["tweet"].get("id") and str(match.get("tweet_id")) == str(entry["tweet"]["id"]):
+                    # The same tweet again, e.g. on a retry: only its new duplicates are added.
+                    entry["seen"] = True
+                else:
+                    self.merged += 1
+                continue
+            kept.append(entry["tweet"])
+        return kept
+
+    def _merge(self, entry: dict, duplicate: dict):
+        self.merged += 1
+        entry["duplicates"] += 1
+        tweet = entry["tweet"]
+        for field in ENGAGEMENT_FIELDS:
+            tweet[field] = _engagement(tweet, field) + _engagement(duplicate, field)
+            entry["merged"][field] += _engagement(duplicate, field)
+        tweet["duplicates"] = entry["duplicates"]
+
+    def commit(self, processed=None):
+        """
+        Persist the run's new tweets and add this run's duplicates to earlier runs' records.
+
+        Parameters:
+            processed (callable, optional): Called with each kept tweet; those for which it
+                returns False, e.g. because their classification failed, are left out.
+        """
+        now = datetime.utcnow()
+        new_documents = []
+        updates = []
+        for entry in self._representatives:
+            tweet = entry["tweet"]
+            if processed is not None and "previous_id" not in entry and not processed(tweet):
+                continue
+            if entry.get("seen"):
+                if entry["duplicates"]:
+                    updates.append((entry["previous_id"], entry["duplicates"], entry["merged"]))
+                continue
+            if "previous_id" in entry:
+                updates.append((entry["previous_id"], entry["duplicates"] + 1, {field: _engagement(tweet, field) for field in ENGAGEMENT_FIELDS}))
+                continue
+            new_documents.append({
+                "product": self.product_name,
+                "bands": entry["bands"],
+                "signature": entry["signature"],
+                "tweet_id": tweet.get("id"),
+                "duplicates": entry["duplicates"],
+                **{field: _engagement(tweet, field) for field in ENGAGEMENT_FIELDS},
+                "created_at": now,
+            })
+        try:
+            ensure_indexes()
+            if new_documents:
+                get_collection().insert_many(new_documents, ordered=False)
+            if updates:
+                get_collection().bulk_write([
+                    UpdateOne({"_id": previous_id}, {"$inc": {"duplicates": duplicates, **engagement}})
+                    for previous_id, duplicates, engagement in updates
+                ], ordered=False)
+        except Exception as e:
+            logger.warning(f"Failed to update dedup index for '{self.product_name}': {e}")
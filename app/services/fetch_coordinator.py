@@ -0,0 +1,402 @@
+import hashlib
+import json
+import logging
+import re
+import threading
+import time
+import unicodedata
+import uuid
+from datetime import datetime, timezone
+from celery.exceptions import SoftTimeLimitExceeded
+from app.core.config import settings
+from app.services.x import MAX_PAGE_SIZE, iter_tweet_pages, parse_time_period
+from app.utils.rate_limit import RateLimitExceeded
+from app.utils.redis_utils import get_redis
+from app.utils.telemetry import Counter
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+FETCH_REQUESTS = Counter(
+    "fetch_requests",
+    "Tweet fetches by how they were served: searched alone, as a coalesced group's leader or member, or from a shared result.",
+    ("outcome",),
+)
+
+_REDIS_PREFIX = "fetch:"
+
+# Plain keyword queries can be merged and routed by text; anything using X's operators
+# (quotes, -exclusions, is:/from: filters, OR, parentheses) is searched on its own.
+_PLAIN_QUERY = re.compile(r"^[\w&'.]+(?:\s+[\w&'.]+)*$")
+
+def coalescable(query: str) -> bool:
+    return bool(_PLAIN_QUERY.match(query.strip())) and " OR " not in f" {query} "
+
+def _fold(text: str) -> str:
+    decomposed = unicodedata.normalize("NFKD", text)
+    return "".join(char for char in decomposed if not unicodedata.combining(char)).casefold()
+
+def _term_pattern(word: str):
+    # X matches keywords as tokens regardless of case and accents, also inside hashtags,
+    # mentions and words joined by underscores or punctuation. Erring on the lenient side
+    # only hands a workflow a tweet its own search might not have returned.
+    return re.compile(r"(?<![^\W_])" + re.escape(_fold(word)) + r"(?![^\W_])")
+
+def _as_utc(value):
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    if value is not None and value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+def _encode_tweets(tweets: list) -> list:
+    return [
+        {**tweet, "created_at": tweet["created_at"].isoformat() if isinstance(tweet.get("created_at"), datetime) else tweet.get("created_at")}
+        for tweet in tweets
+    ]
+
+def _decode_tweets(tweets: list) -> list:
+    return [{**tweet, "created_at": _as_utc(tweet.get("created_at"))} for tweet in tweets]
+
+class FetchRequest:
+    """One workflow's search: its query, time window and tweet budget."""
+
+    def __init__(self, query: str, time_period: str, max_tweets: int, since_id: str = None, request_id: str = None, start_time: str = None, until_id: str = None):
+        self.query = " ".join(query.split())
+        self.time_period = time_period
+        self.max_tweets = max_tweets
+        self.since_id = str(since_id) if since_id else None
+        self.until_id = str(until_id) if until_id else None
+        self.request_id = request_id or uuid.uuid4().hex
+        self.start_time = start_time or (datetime.utcnow() - parse_time_period(time_period)).isoformat()
+        self._patterns = [_term_pattern(word) for word in self.query.lower().split()]
+
+    def to_json(self) -> str:
+        return json.dumps({
+            "query": self.query,
+            "time_period": self.time_period,
+            "max_tweets": self.max_tweets,
+            "since_id": self.since_id,
+            "request_id": self.request_id,
+            "start_time": self.start_time,
+            "until_id": self.until_id,
+        })
+
+    @classmethod
+    def from_json(cls, value: str) -> "FetchRequest":
+        return cls(**json.loads(value))
+
+    def share_key(self) -> str:
+        """Identifies requests that would return the same tweets."""
+        digest = hashlib.sha256(json.dumps([self.query.lower(), self.time_period, self.since_id, self.until_id]).encode()).hexdigest()[:32]
+        return f"{_REDIS_PREFIX}shared:{digest}"
+
+    def accepts(self, tweet: dict) -> bool:
+        """Whether the tweet belongs to this request's results: in its window and matching every word."""
+        if self.since_id and int(tweet["id"]) <= int(self.since_id):
+            return False
+        if self.until_id and int(tweet["id"]) >= int(self.until_id):
+            return False
+        created_at = _as_utc(tweet.get("created_at"))
+        if not self.since_id and created_at is not None and created_at < datetime.fromisoformat(self.start_time):
+            return False
+        text = _fold(tweet.get("text") or "")
+        return all(pattern.search(text) for pattern in self._patterns)
+
+def build_queries(terms: list, max_length: int) -> list:
+    """
+    Pack terms into as few OR-queries as fit within max_length characters.
+
+    Returns:
+        list: (query, terms) pairs.
+    """
+    groups = []
+    for term in terms:
+        part = f"({term})" if " " in term else term
+        if groups and len(groups[-1][0]) + len(" OR ") + len(part) <= max_length:
+            query, members = groups[-1]
+            groups[-1] = (f"{query} OR {part}", members + [term])
+        else:
+            groups.append((part, [term]))
+    return [(query if len(members) > 1 else members[0], members) for query, members in groups]
+
+def search_group(requests: list):
+    """
+    Serve several requests with as few searches as possible, streaming their tweets page by page.
+
+    Every OR-query covers the widest window and the combined budget of its requests, newest
+    first; each returned tweet is handed to every request that accepts it, up to its own
+    max_tweets. Each request also gets the id it should resume from (see iter_tweet_pages):
+    its own oldest tweet once it has max_tweets, the oldest tweet the search reached when
+    the combined budget ran out first, and None when X had no more matches.
+
+    Yields:
+        tuple: (request id, message) pairs: {"tweets": [...]} for every page holding tweets for
+               the request, then once {"until_id": str or None}, {"error": str} or
+               {"error": str, "retry_after": float} when the X budget ran out.
+    """
+    by_term = {}
+    for request in requests:
+        by_term.setdefault(request.query.lower(), []).append(request)
+
+    for query, terms in build_queries(list(by_term), settings.X_MAX_QUERY_LENGTH):
+        members = [request for term in terms for request in by_term[term]]
+        counts = {request.request_id: 0 for request in members}
+        oldest = {request.request_id: None for request in members}
+        since_ids = [request.since_id for request in members]
+        since_id = min(since_ids, key=int) if all(since_ids) else None
+        until_ids = [request.until_id for request in members]
+        until_id = max(until_ids, key=int) if all(until_ids) else None
+        time_period = max((request.time_period for request in members), key=parse_time_period)
+        budget = sum(request.max_tweets for request in members)
+        search_oldest = None
+        pages = iter_tweet_pages(query, time_period, budget, since_id=since_id, until_id=until_id, sort_order="recency")
+        try:
+            while True:
+                try:
+                    page = next(pages)
+                except StopIteration as stop:
+                    search_until_id = stop.value
+                    break
+                routed = {request.request_id: [] for request in members}
+                for tweet in page:
+                    if search_oldest is None or int(tweet["id"]) < int(search_oldest):
+                        search_oldest = tweet["id"]
+                    for request in members:
+                        if counts[request.request_id] < request.max_tweets and request.accepts(tweet):
+                            counts[request.request_id] += 1
+                            routed[request.request_id].append(tweet)
+                            if oldest[request.request_id] is None or int(tweet["id"]) < int(oldest[request.request_id]):
+                                oldest[request.request_id] = tweet["id"]
+                for request_id, tweets in routed.items():
+                    if tweets:
+                        yield request_id, {"tweets": tweets}
+                if all(counts[request.request_id] >= request.max_tweets for request in members):
+                    search_until_id = search_oldest
+                    break
+        except RateLimitExceeded as e:
+            for request in members:
+                yield request.request_id, {"error": str(e), "retry_after": e.retry_after}
+            continue
+        except SoftTimeLimitExceeded:
+            # The task's time is up; it must end rather than report an error per request.
+            raise
+        except Exception as e:
+            for request in members:
+                yield request.request_id, {"error": str(e)}
+            continue
+        for request in members:
+            if counts[request.request_id] >= request.max_tweets:
+                resume_id = oldest[request.request_id]
+            elif search_until_id and request.since_id and int(search_until_id) <= int(request.since_id):
+                # The search went past this request's own lower bound, so it got every match.
+                resume_id = None
+            else:
+                resume_id = search_until_id
+            yield request.request_id, {"until_id": resume_id}
+
+def _raise_for(request: FetchRequest, message: dict):
+    if "retry_after" in message:
+        raise RateLimitExceeded(f"x:search:{request.query}", message["retry_after"])
+    if "error" in message:
+        raise RuntimeError(message["error"])
+    return message["until_id"]
+
+# Joins the open group of a time period, opening one if there is none. KEYS[2] marks that a
+# request arrived within the last window.
+# Returns the group id, 1 when the caller opened it and leads it, and 1 when another
+# request arrived within the window before it.
+_JOIN_SCRIPT = """
+local busy = redis.call('EXISTS', KEYS[2])
+redis.call('SET', KEYS[2], '1', 'PX', ARGV[5])
+local group = redis.call('GET', KEYS[1])
+local leader = 0
+if not group then
+    group = ARGV[1]
+    redis.call('SET', KEYS[1], group, 'PX', ARGV[3])
+    leader = 1
+end
+local members = ARGV[4] .. group
+redis.call('RPUSH', members, ARGV[2])
+redis.call('PEXPIRE', members, ARGV[3])
+return {group, leader, busy}
+"""
+
+# Closes a group to new members and returns the requests that joined it.
+_CLOSE_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    redis.call('DEL', KEYS[1])
+end
+local members = redis.call('LRANGE', KEYS[2], 0, -1)
+redis.call('DEL', KEYS[2])
+return members
+"""
+
+# Returned by _RedisGroups.fetch when no result arrived in time.
+_NO_RESULT = object()
+
+class _RedisGroups:
+    """
+    Groups shared by every worker through Redis. The leader searches on a background thread
+    and streams each member's pages, the leader's own included, to a per-request list.
+    """
+
+    def __init__(self, redis_client):
+        self.redis = redis_client
+        self._join = redis_client.register_script(_JOIN_SCRIPT)
+        self._close = redis_client.register_script(_CLOSE_SCRIPT)
+
+    def fetch(self, request: FetchRequest):
+        """
+        Yield the request's pages as the group's search streams them.
+
+        Returns:
+            str: The id to resume from, or _NO_RESULT when no page arrived in time.
+        """
+        open_key = f"{_REDIS_PREFIX}open:{request.time_period}"
+        arrived_key = f"{_REDIS_PREFIX}arrived:{request.time_period}"
+        members_prefix = f"{_REDIS_PREFIX}members:"
+        # The open group expires on its own if its leader dies before closing it.
+        expiry_ms = int((settings.FETCH_COALESCE_WINDOW * 2 + 5) * 1000)
+        window_ms = max(1, int(settings.FETCH_COALESCE_WINDOW * 1000))
+        group, leader, busy = self._join(
+            keys=[open_key, arrived_key],
+            args=[uuid.uuid4().hex, request.to_json(), expiry_ms, members_prefix, window_ms],
+        )
+        timeout = settings.FETCH_WAIT_TIMEOUT
+        if int(leader):
+            FETCH_REQUESTS.inc(outcome="leader")
+            # Waiting only pays off while workflows arrive together; one on its own searches right away.
+            if int(busy):
+                time.sleep(settings.FETCH_COALESCE_WINDOW)
+            requests = [FetchRequest.from_json(value) for value in self._close(keys=[open_key, members_prefix + group], args=[group])]
+            if not any(member.request_id == request.request_id for member in requests):
+                requests.append(request)
+            threading.Thread(target=self._lead, args=(requests,), name="fetch-group", daemon=True).start()
+        else:
+            FETCH_REQUESTS.inc(outcome="member")
+            timeout += settings.FETCH_COALESCE_WINDOW
+
+        result_key = f"{_REDIS_PREFIX}result:{request.request_id}"
+        received = False
+        while True:
+            popped = self.redis.blpop([result_key], timeout=int(timeout))
+            if not popped:
+                if not received:
+                    return _NO_RESULT
+                raise RuntimeError(f"The coalesced search for '{request.query}' stopped sending results.")
+            message = json.loads(popped[1])
+            if "tweets" not in message:
+                return _raise_for(request, message)
+            received = True
+            yield _decode_tweets(message["tweets"])
+            timeout = settings.FETCH_WAIT_TIMEOUT
+
+    def _lead(self, requests: list):
+        ended = set()
+        try:
+            for request_id, message in search_group(requests):
+                self._send(request_id, message)
+                if "tweets" not in message:
+                    ended.add(request_id)
+        except Exception as e:
+            # Runs on its own thread, which the task's soft time limit never interrupts.
+            logger.error(f"Coalesced search failed: {e}")
+            for member in requests:
+                if member.request_id not in ended:
+                    self._send(member.request_id, {"error": str(e)})
+
+    def _send(self, request_id: str, message: dict):
+        if "tweets" in message:
+            message = {**message, "tweets": _encode_tweets(message["tweets"])}
+        member_key = f"{_REDIS_PREFIX}result:{request_id}"
+        pipe = self.redis.pipeline()
+        pipe.rpush(member_key, json.dumps(message))
+        pipe.expire(member_key, int(settings.FETCH_WAIT_TIMEOUT))
+        pipe.execute()
+
+class _SharedResults:
+    """Recently fetched results in Redis, reused by identical requests for FETCH_SHARE_TTL seconds."""
+
+    def __init__(self, redis_client):
+        self.redis = redis_client
+
+    def get(self, request: FetchRequest):
+        """Return the shared tweets for the request and the id to resume from, or None."""
+        value = self.redis.get(request.share_key())
+        shared = json.loads(value) if value else None
+        if not shared:
+            return None
+        tweets = shared["tweets"]
+        if len(tweets) >= request.max_tweets:
+            tweets = tweets[:request.max_tweets]
+            until_id = min((tweet["id"] for tweet in tweets), key=int) if tweets else None
+            return _decode_tweets(tweets), until_id
+        # A shorter earlier result only answers this request if it held every match.
+        if shared["until_id"] is None:
+            return _decode_tweets(tweets), None
+        return None
+
+    def put(self, request: FetchRequest, tweets: list, until_id: str = None):
+        shared = {"tweets": _encode_tweets(tweets), "until_id": until_id}
+        self.redis.set(request.share_key(), json.dumps(shared), ex=max(1, int(settings.FETCH_SHARE_TTL)))
+
+def iter_coordinated_pages(product: str, time_period: str, max_tweets: int = 10, since_id: str = None, until_id: str = None, sort_order: str = "relevancy"):
+    """
+    Page through tweets matching the product query like iter_tweet_pages, but share the
+    search with the other workflows fetching at the same time.
+
+    Workflows arriving within FETCH_COALESCE_WINDOW seconds of each other for the same time
+    period form a group. One of them searches for all with combined OR-queries, newest first
+    whatever sort_order asks for, and streams every page's tweets to each workflow whose
+    words they contain. It only waits for others to join while workflows are arriving
+    together. Identical requests within FETCH_SHARE_TTL seconds reuse the earlier result,
+    for requests of at most FETCH_SHARE_MAX_TWEETS tweets; larger ones are not held in
+    memory to be shared.
+    Queries using search operators are searched on their own, and so is everything when
+    FETCH_COALESCE_ENABLED is off or REDIS_URL is not set, since the workflows to share with
+    run in other processes.
+
+    Yields:
+        list: Formatted tweets, at most 100 per page.
+
+    Returns:
+        str: The id to resume from, as returned by iter_tweet_pages.
+
+    Raises:
+        RateLimitExceeded: If the X budget ran out for the group's search.
+        RuntimeError: If the group's search failed.
+    """
+    redis_client = get_redis()
+    if not settings.FETCH_COALESCE_ENABLED or redis_client is None or not coalescable(product):
+        FETCH_REQUESTS.inc(outcome="alone")
+        return (yield from iter_tweet_pages(product, time_period, max_tweets, since_id=since_id, until_id=until_id, sort_order=sort_order))
+
+    request = FetchRequest(product, time_period, max_tweets, since_id=since_id, until_id=until_id)
+    shared = _SharedResults(redis_client) if max_tweets <= settings.FETCH_SHARE_MAX_TWEETS else None
+    found = shared.get(request) if shared else None
+    if found is not None:
+        FETCH_REQUESTS.inc(outcome="shared")
+        tweets, resume_id = found
+        for start in range(0, len(tweets), MAX_PAGE_SIZE):
+            yield tweets[start:start + MAX_PAGE_SIZE]
+        return resume_id
+
+    tweets = []
+    pages = _RedisGroups(redis_client).fetch(request)
+    while True:
+        try:
+            page = next(pages)
+        except StopIteration as stop:
+            resume_id = stop.value
+            break
+        if shared:
+            tweets.extend(page)
+        yield page
+    if resume_id is _NO_RESULT:
+        logger.warning(f"Coalesced fetch for '{product}' got no result in time; searching alone.")
+        FETCH_REQUESTS.inc(outcome="alone")
+        return (yield from iter_tweet_pages(product, time_period, max_tweets, since_id=since_id, until_id=until_id, sort_order=sort_order))
+    if shared:
+        shared.put(request, tweets, resume_id)
+    return resume_id
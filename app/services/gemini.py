@@ -1,14 +1,153 @@
+import hashlib
 import json
-import google.generativeai as genai 
+import os
+import threading
+from collections import OrderedDict
 from app.core.config import settings
+from app.utils.telemetry import external_call
 import logging
 
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
 
-GEMINI_API_KEY = settings.GEMINI_API_KEY
-genai.configure(api_key=GEMINI_API_KEY)
-model = genai.GenerativeModel("gemini-2.0-flash")
+MODEL_NAME = "gemini-2.0-flash"
+# Models compiled for the most recent (rules, product description) pairs.
+MAX_CACHED_MODELS = 32
+
+_models = OrderedDict()
+_models_lock = threading.Lock()
+_configured = False
+
+def _reset_models():
+    # gRPC channels do not survive fork; each Celery child builds its own models.
+    global _models, _models_lock, _configured
+    _models = OrderedDict()
+    _models_lock = threading.Lock()
+    _configured = False
+
+os.register_at_fork(after_in_child=_reset_models)
+
+OUTPUT_FIELDS = """1. "add": A boolean indicating whether to add the post as a Trello card. The post must be relevant to the product and must be one of the defined request types below.
+        If it is not one of the following [Bug/Problem Report, Feature Request, or Suggestions to the product], this should be set to false.
+2. "card_name": A title determined solely by the content. It must be prefixed by one of:
+   "[Bug Report]", "[Feature Request]", "[Improvement Suggestion]", with a concise title for the product development team to understand.
+3. "priority": A string "High", "Medium", or "Low" based on the engagement metrics and the given rules.
+4. "card_description": A concise yet detailed task description. It should understand what should be done to address what's on the post.
+   be written in a clear tone for the team, and end with the source URL if available.
+5. "reason": When "add" is false, a few words on why.
+"""
+
+PRIORITIES = ["High", "Medium", "Low"]
+
+# Fields an answer with "add" true needs to become a card. The schema cannot make them
+# conditionally required, so valid_classification checks them.
+CARD_REQUIRED_FIELDS = ("card_name", "priority")
+
+# Enforced by Gemini's JSON mode, so answers no longer need cleaning up before parsing.
+RESPONSE_SCHEMA = {
+    "type": "ARRAY",
+    "items": {
+        "type": "OBJECT",
+        "properties": {
+            "id": {"type": "STRING"},
+            "add": {"type": "BOOLEAN"},
+            "card_name": {"type": "STRING"},
+            "priority": {"type": "STRING", "format": "enum", "enum": PRIORITIES},
+            "card_description": {"type": "STRING"},
+            "reason": {"type": "STRING"},
+        },
+        "required": ["id", "add"],
+    },
+}
+
+GENERATION_CONFIG = {
+    "temperature": 0.1,
+    "top_p": 0.95,
+    "response_mime_type": "application/json",
+    "response_schema": RESPONSE_SCHEMA,
+}
+
+def system_instruction(prioritization_rule, product_description: str) -> str:
+    """The instructions shared by every request of a run; only the posts change per call."""
+    return f"""You are an intelligent assistant that determines if X posts (tweets) should be added as Trello cards for a product development.
+Prioritization rules (if not set, use your own judgement): {json.dumps(prioritization_rule, separators=(",", ":"))}
+Product description: {product_description}
+
+Each message is a JSON array of posts with an "id", "text", "likes" and "retweets".
+Judge every post on its own and answer with one object per post, holding the post's "id" unchanged and these fields:
+{OUTPUT_FIELDS}"""
+
+# Identifies the instructions and generation settings answers were produced with, so that
+# cached classifications are not reused once either changes.
+PROMPT_VERSION = hashlib.sha256(
+    json.dumps([MODEL_NAME, system_instruction(None, ""), GENERATION_CONFIG, CARD_REQUIRED_FIELDS], sort_keys=True).encode()
+).hexdigest()[:16]
+
+def valid_classification(result) -> bool:
+    """Whether an answer is usable: "add" is a boolean and, when true, a card name and known priority are given."""
+    if not isinstance(result, dict) or not isinstance(result.get("add"), bool):
+        return False
+    if not result["add"]:
+        return True
+    return all(isinstance(result.get(field), str) and result[field].strip() for field in CARD_REQUIRED_FIELDS) \
+        and result["priority"] in PRIORITIES
+
+def _configure(genai):
+    global _configured
+    if _configured:
+        return
+    if not settings.GEMINI_API_KEY:
+        raise RuntimeError("GEMINI_API_KEY is not configured.")
+    if settings.GEMINI_API_ENDPOINT:
+        # Point the REST transport at another host, e.g. the offline benchmark stand-in.
+        genai.configure(api_key=settings.GEMINI_API_KEY, transport="rest", client_options={"api_endpoint": settings.GEMINI_API_ENDPOINT})
+    else:
+        genai.configure(api_key=settings.GEMINI_API_KEY)
+    _configured = True
+
+def get_model(prioritization_rule, product_description: str):
+    """
+    Return a Gemini model with the run's rules and product description compiled into its
+    system instruction, reusing the one built earlier for the same pair.
+
+    google.generativeai is imported and configured here rather than at module import, so
+    processes that never classify (the API, beat) neither pay for it nor need GEMINI_API_KEY.
+    Keeping the instructions identical across calls also lets Gemini reuse the prefix.
+
+    Raises:
+        RuntimeError: If GEMINI_API_KEY is not configured.
+    """
+    instruction = system_instruction(prioritization_rule, product_description)
+    with _models_lock:
+        model = _models.get(instruction)
+        if model is None:
+            import google.generativeai as genai
+            _configure(genai)
+            model = _models[instruction] = genai.GenerativeModel(MODEL_NAME, system_instruction=instruction)
+            if len(_models) > MAX_CACHED_MODELS:
+                _models.popitem(last=False)
+        else:
+            _models.move_to_end(instruction)
+        return model
+
+def _post_payload(pid: str, x_post: dict) -> dict:
+    return {
+        "id": pid,
+        "text": x_post.get("text", ""),
+        "likes": x_post.get("likes", 0),
+        "retweets": x_post.get("retweets", 0),
+    }
+
+def _generate(x_posts: dict, prioritization_rule, product_description: str, operation: str) -> list:
+    # Only the posts are sent; the instructions travel as the model's system instruction.
+    content = json.dumps([_post_payload(pid, x_post) for pid, x_post in x_posts.items()], separators=(",", ":"), default=str)
+    model = get_model(prioritization_rule, product_description)
+    with external_call("gemini", operation):
+        response = model.generate_content(content, generation_config=GENERATION_CONFIG)
+    items = json.loads(response.text)
+    if not isinstance(items, list):
+        raise ValueError("Expected a JSON array of classifications")
+    return items
 
 def post_to_card(x_post: dict, prioritization_rule: dict, product_description: str):
     """
@@ -27,64 +166,62 @@ def post_to_card(x_post: dict, prioritization_rule: dict, product_description: s
               "card_description": str
             }
     """
-    # Construct a prompt that gives Gemini the rules and the X post details.
-    prompt = f"""
-You are an intelligent assistant that determines if an X post (tweet) should be added as a Trello card for a product development.
-Here are the dynamic priority rules: (If not set, use your own judgement)
-    Prioritization Rule: {json.dumps(prioritization_rule, indent=2)}
-Product description: {product_description}
-
-The X post has these properties:
-- text: {x_post.get("text", "")}
-- likes: {x_post.get("likes", 0)}
-- retweets: {x_post.get("retweets", 0)}
-
-Based on the above, generate a structured JSON output that meets the following:
-1. "add": A boolean indicating whether to add the post as a Trello card. The post must be relevant to the product and must be one of the defined request types below.
-        If it is not one of the following [Bug/Problem Report, Feature Request, or Suggestions to the product], this should be set to false.
-2. "card_name": A title determined solely by the content. It must be prefixed by one of:
-   "[Bug Report]", "[Feature Request]", "[Improvement Suggestion]", with a concise title for the product development team to understand.
-3. "priority": A string "High", "Medium", or "Low" based on the engagement metrics and the given rules.
-4. "card_description": A concise yet detailed task description. It should understand what should be done to address what's on the post.
-   be written in a clear tone for the team, and end with the source URL if available.
-
-Return only a valid JSON object without any additional text or code wrappers.
-
-Example Output: When add is False
+    pid = post_id(x_post, 0)
+    try:
+        items = _generate({pid: x_post}, prioritization_rule, product_description, "generate_content")
+        result = next(item for item in items if isinstance(item, dict))
+        result.pop("id", None)
+        if not valid_classification(result):
+            return {"success": False, "error": f"Gemini returned an incomplete classification: {json.dumps(result)}"}
+        return {"success": True, "result": result}
+    except StopIteration:
+        return {"success": False, "error": "Gemini returned no classification"}
+    except Exception as e:
+        return {"success": False, "error": str(e)}
 
-{{
-  'add': false,
-  'reason': ''
-}}
+def post_id(x_post: dict, index: int) -> str:
+    """Return the id a post is keyed by in batch results, falling back to its position."""
+    return str(x_post.get("id") or index)
 
----
+def classify_batch(x_posts: dict, prioritization_rule: dict, product_description: str):
+    """
+    Use a single Gemini request to classify several X posts.
 
-Another Example: When add is True
+    The rules and product description travel once, as the system instruction of the
+    run's model, and the model answers with one JSON object per post, tagged with the
+    post id it belongs to. Posts the model drops or answers with something unusable are
+    retried one at a time through post_to_card, so a bad batch response never loses a tweet.
 
-{{
-   'add': true,
-   'card_name': '[Bug Report] App crashes on startup',
-   'priority': 'High',
-   'card_description': 'The app crashes immediately on startup. Investigate the issue and provide a fix. Source: x.com/post/12345'
-}}
-"""
+    Parameters:
+      x_posts (dict): Maps a post id to the post, as accepted by post_to_card.
+      prioritization_rule (dict): Dynamic priority rules.
+      product_description (str): Description of the product the posts are about.
 
-    # Call the Gemini API using the genai client.
-    response =  model.generate_content(
-                prompt,
-                generation_config={
-                    "temperature": 0.1,
-                    "top_p": 0.95,
-                }
-            )
-    response_text = response.text.strip().replace("```json", "").replace('```', '')
+    Returns:
+      dict: Maps every post id in x_posts to a post_to_card style result
+            ({"success": True, "result": {...}} or {"success": False, "error": str}).
+    """
+    if len(x_posts) == 1:
+        (only_id, only_post), = x_posts.items()
+        return {only_id: post_to_card(only_post, prioritization_rule, product_description)}
 
+    results = {}
     try:
-        result = json.loads(response_text)
-        return {"success": True, "result": result}
+        for item in _generate(x_posts, prioritization_rule, product_description, "generate_content_batch"):
+            if not isinstance(item, dict):
+                continue
+            pid = str(item.pop("id", ""))
+            if pid in x_posts and pid not in results and valid_classification(item):
+                results[pid] = {"success": True, "result": item}
     except Exception as e:
-        print(response_text)
-        return {"success": False, "error": str(e)}
+        logger.warning(f"Batch classification of {len(x_posts)} posts failed: {e}")
+
+    missing = [pid for pid in x_posts if pid not in results]
+    if missing:
+        logger.warning(f"Retrying {len(missing)} of {len(x_posts)} posts individually.")
+    for pid in missing:
+        results[pid] = post_to_card(x_posts[pid], prioritization_rule, product_description)
+    return results
 
 # Example usage (for testing purposes):
 if __name__ == "__main__":
@@ -1,12 +1,343 @@
-from app.services.x import fetch_tweets
-from app.services.gemini import post_to_card
-from app.services.trello import add_trello_card
+from celery.exceptions import SoftTimeLimitExceeded
+from app.core.config import settings
+from app.database import get_db
+from app.repositories.tasks import get_task_progress, save_task_progress
+from app.services.x import parse_time_period
+from app.services.fetch_coordinator import iter_coordinated_pages
+from app.services import card_ledger, classification_cache
+from app.services.dedup import DedupIndex
+from app.services.prefilter import Prefilter
+from app.services.gemini import MODEL_NAME, PROMPT_VERSION, classify_batch, post_id, valid_classification
+from app.services.trello import add_trello_cards, resolve_destination
+from app.utils.rate_limit import RateLimitExceeded
+from app.utils.telemetry import PIPELINE_ITEMS, PIPELINE_STAGE_SECONDS
+from app.utils.mongo_utils import get_fetch_checkpoint, set_fetch_backlog, update_fetch_checkpoint
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime
 import logging
+import queue
+import threading
 import time
 
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
 
+# Sentinel telling a card writer that no more cards will arrive.
+_STOP = object()
+
+class IncompleteRun(Exception):
+    """
+    Raised by a task's run when some tweets could not be classified or carded, once the
+    others are done, so the task is retried for them after retry_after seconds. result is
+    the run's result.
+    """
+
+    def __init__(self, message: str, result: dict, retry_after: float):
+        super().__init__(message)
+        self.result = result
+        self.retry_after = retry_after
+
+class MetricsCounter:
+    """
+    Thread-safe increments on the shared metrics dict, used by concurrent pipeline stages.
+
+    When on_progress is given, it is called with a snapshot of the metrics after changes,
+    at most once per PROGRESS_INTERVAL seconds. Seconds spent per stage are summed in
+    timings; stages running on several threads add up the time of all of them. Tweets
+    that were not fully processed are kept in failed by their card_ledger.source_key.
+    """
+
+    def __init__(self, metrics: dict, on_progress=None):
+        self.metrics = metrics
+        self.on_progress = on_progress
+        self.timings = {}
+        self.failed = set()
+        self._lock = threading.Lock()
+        self._last_progress = 0.0
+
+    def incr(self, key: str, amount: int = 1):
+        with self._lock:
+            self.metrics[key] += amount
+
+    def fail(self, key: str, source_key: str):
+        with self._lock:
+            self.metrics[key] += 1
+            self.failed.add(source_key)
+
+    def add_time(self, stage: str, seconds: float):
+        with self._lock:
+            self.timings[stage] = self.timings.get(stage, 0.0) + seconds
+
+    @contextmanager
+    def timed(self, stage: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(stage, time.perf_counter() - start)
+
+    def report(self, force: bool = False):
+        if self.on_progress is None:
+            return
+        with self._lock:
+            now = time.monotonic()
+            if not force and now - self._last_progress < settings.PROGRESS_INTERVAL:
+                return
+            self._last_progress = now
+            snapshot = dict(self.metrics)
+        try:
+            self.on_progress(snapshot)
+        except Exception as e:
+            logger.warning(f"Progress callback failed: {e}")
+
+class TaskProgress:
+    """
+    Per-tweet progress of a Celery task, kept on its document so that a retried or
+    redelivered run skips the work earlier attempts finished.
+
+    A tweet is "classified" once its card is known, the card being kept until Trello has
+    it, and "done" when nothing is left to do for it. Updates are buffered and written
+    together every TASK_PROGRESS_BATCH_SIZE tweets and on flush(). Tweets without an id
+    are not tracked, as nothing identifies them across attempts.
+    """
+
+    CLASSIFIED = "classified"
+    DONE = "done"
+
+    def __init__(self, task_id: str):
+        self.task_id = task_id
+        self.entries = get_task_progress(get_db(), task_id)
+        self._pending = {}
+        self._lock = threading.Lock()
+
+    def resume(self, tweets: list):
+        """
+        Split tweets by what earlier attempts did with them.
+
+        Returns:
+            tuple: (tweets still to classify, cards classified earlier but not created yet,
+                    number of tweets already done)
+        """
+        todo, cards, done = [], [], 0
+        for tweet in tweets:
+            entry = self.entries.get(str(tweet["id"])) if tweet.get("id") else None
+            if entry is None:
+                todo.append(tweet)
+            elif entry["state"] == self.DONE:
+                done += 1
+            elif not valid_classification(entry.get("card")):
+                # Saved before incomplete answers were rejected; classify it again.
+                todo.append(tweet)
+            else:
+                cards.append(entry["card"])
+        return todo, cards, done
+
+    def classified(self, tweet_id, card: dict = None):
+        """Record a tweet's classification: its card, or None when it needs none."""
+        self._record(tweet_id, {"state": self.CLASSIFIED, "card": card} if card else {"state": self.DONE})
+
+    def done(self, tweet_id):
+        self._record(tweet_id, {"state": self.DONE})
+
+    def _record(self, tweet_id, entry: dict):
+        if not tweet_id:
+            return
+        with self._lock:
+            self._pending[str(tweet_id)] = entry
+            if len(self._pending) >= settings.TASK_PROGRESS_BATCH_SIZE:
+                self._write()
+
+    def flush(self):
+        with self._lock:
+            self._write()
+
+    def _write(self):
+        # Runs under the lock, so a tweet's updates reach the document in order.
+        pending, self._pending = self._pending, {}
+        try:
+            save_task_progress(get_db(), self.task_id, pending)
+        except Exception as e:
+            logger.warning(f"Failed to save progress of task {self.task_id}: {e}")
+
+def classify_stage(batch: dict, prioritization_rule, product_description: str, card_queue: queue.Queue, counter: MetricsCounter, product_name: str = None, progress: TaskProgress = None):
+    """
+    Classify one batch of tweets and hand the actionable cards to the card writers.
+
+    Blocks on card_queue when the writers fall behind, which in turn holds back
+    further classification batches.
+    """
+    with counter.timed('classification'):
+        classifications = {}
+        cache_keys = {}
+        if settings.CLASSIFICATION_CACHE_ENABLED:
+            cache_keys = {
+                pid: classification_cache.cache_key(tweet, prioritization_rule, product_description, MODEL_NAME, PROMPT_VERSION)
+                for pid, tweet in batch.items()
+            }
+            cached = classification_cache.get_cached(list(set(cache_keys.values())))
+            classifications = {pid: cached[key] for pid, key in cache_keys.items() if key in cached}
+            counter.incr('classification_cache_hits', len(classifications))
+            counter.incr('classification_cache_misses', len(batch) - len(classifications))
+
+        misses = {pid: tweet for pid, tweet in batch.items() if pid not in classifications}
+        if misses:
+            try:
+                fresh = classify_batch(misses, prioritization_rule, product_description)
+            except Exception as e:
+                logger.error(f"Classification failed for a batch of {len(misses)} tweets: {e}")
+                fresh = {pid: {"success": False, "error": str(e)} for pid in misses}
+            classifications.update(fresh)
+            if cache_keys:
+                classification_cache.store(
+                    {cache_keys[pid]: result for pid, result in fresh.items()},
+                    {cache_keys[pid]: misses[pid] for pid in fresh if pid in misses},
+                    product_name,
+                )
+
+    for pid in batch:
+        counter.incr('processed_tweets')
+        classification = classifications[pid]
+        if classification["success"]:
+            card = classification["result"]
+            tweet_id = batch[pid].get("id")
+            if card.get("add", False):
+                # The source lets the card ledger skip tweets that already have a card.
+                card = {**card, "source_key": card_ledger.source_key(batch[pid]), "tweet_id": tweet_id}
+                if progress:
+                    progress.classified(tweet_id, card)
+                card_queue.put(card)
+            elif progress:
+                progress.classified(tweet_id)
+        else:
+            counter.fail('classification_errors', card_ledger.source_key(batch[pid]))
+            logger.error(f"Classification failed for tweet: {classification['error']}")
+    counter.report()
+
+def card_writer(card_queue: queue.Queue, counter: MetricsCounter, trello_api_key: str, trello_token: str, list_name: str, board_id: str = None, board_name: str = None, progress: TaskProgress = None):
+    """
+    Add cards from card_queue to Trello until the _STOP sentinel arrives.
+
+    Whatever has queued up while the previous cards were being written goes out
+    together through add_trello_cards.
+    """
+    stopped = False
+    while not stopped:
+        cards = [card_queue.get()]
+        while len(cards) < card_queue.maxsize:
+            try:
+                cards.append(card_queue.get_nowait())
+            except queue.Empty:
+                break
+        if _STOP in cards:
+            stopped = True
+            cards = [card for card in cards if card is not _STOP]
+        if not cards:
+            continue
+
+        # Resolved here so its time is counted apart; add_trello_cards then finds the destination cached.
+        try:
+            with counter.timed('destination_resolution'):
+                resolve_destination(trello_api_key, trello_token, list_name, board_id=board_id, board_name=board_name)
+        except Exception as e:
+            logger.error(f"Failed to resolve Trello list '{list_name}', {len(cards)} cards not added: {e}")
+            for card in cards:
+                counter.fail('trello_errors', card.get("source_key"))
+            counter.report()
+            continue
+        with counter.timed('card_creation'):
+            add_responses = add_trello_cards(cards, trello_api_key, trello_token, list_name, board_id, board_name)
+        for card, add_response in zip(cards, add_responses):
+            if progress and add_response["success"]:
+                progress.done(card.get("tweet_id"))
+            if add_response.get("duplicate"):
+                counter.incr('duplicate_cards_skipped')
+                logger.info(f"Skipped card '{card['card_name']}': the tweet already has a card.")
+            elif add_response["success"]:
+                counter.incr('cards_added')
+                logger.info(f"Added card '{card['card_name']}' to Trello.")
+            elif add_response.get("in_progress"):
+                counter.fail('cards_in_progress', card.get("source_key"))
+                logger.warning(f"Card '{card.get('card_name')}' is reserved by another run; leaving it for a retry.")
+            else:
+                counter.fail('trello_errors', card.get("source_key"))
+                logger.error(f"Failed to add card '{card.get('card_name')}': {add_response['error']}")
+        counter.report()
+
+def checkpoint_window(product_name: str, time_period: str):
+    """
+    Return the product's checkpoint and the (since_id, until_id) window to fetch from it.
+
+    The run fetches what came after the checkpoint's newest tweet. When an earlier run was
+    cut short by max_tweets, the checkpoint holds a backlog: the tweets between its newest
+    tweet and backlog["until_id"] that were not fetched yet, which are fetched first.
+    since_id is None to search the whole time period (first run, or the checkpoint is older
+    than the period anyway).
+    """
+    try:
+        checkpoint = get_fetch_checkpoint(get_db(), product_name, product_name)
+    except Exception as e:
+        logger.warning(f"Failed to read fetch checkpoint for '{product_name}': {e}")
+        return None, None, None
+    if not checkpoint:
+        return None, None, None
+    period_start = datetime.utcnow() - parse_time_period(time_period)
+    since_id = None
+    if checkpoint.get("newest_created_at") and checkpoint["newest_created_at"] >= period_start:
+        since_id = str(checkpoint["newest_id"])
+    backlog = checkpoint.get("backlog")
+    if backlog and backlog.get("newest_created_at") and backlog["newest_created_at"] >= period_start:
+        return checkpoint, since_id, str(backlog["until_id"])
+    return checkpoint, since_id, None
+
+def newer_tweet(current: dict, candidates: list):
+    """Return whichever of current and the candidate tweets has the highest id."""
+    for tweet in candidates:
+        if tweet.get("id") and (current is None or int(tweet["id"]) > int(current["id"])):
+            current = tweet
+    return current
+
+def save_checkpoint(product_name: str, checkpoint: dict, until_id: str, newest: dict, resume_until_id: str):
+    """
+    Move the checkpoint past a run whose fetched tweets were all processed.
+
+    resume_until_id is what the fetch returned: None when it got every tweet of its window,
+    otherwise the oldest tweet it got, below which the window still holds unfetched tweets.
+    The checkpoint only advances once nothing is left between it and the newest tweet seen;
+    until then the gap is kept as a backlog for the next runs.
+    """
+    backlog = (checkpoint or {}).get("backlog") if until_id else None
+    try:
+        if resume_until_id is None:
+            if backlog:
+                newest = {"id": backlog["newest_id"], "created_at": backlog.get("newest_created_at")}
+            if newest is not None:
+                update_fetch_checkpoint(get_db(), product_name, product_name, newest["id"], newest.get("created_at"))
+            if backlog:
+                set_fetch_backlog(get_db(), product_name, product_name)
+        elif backlog:
+            set_fetch_backlog(get_db(), product_name, product_name, {**backlog, "until_id": resume_until_id})
+        elif newest is not None:
+            set_fetch_backlog(get_db(), product_name, product_name, {
+                "until_id": resume_until_id,
+                "newest_id": newest["id"],
+                "newest_created_at": newest.get("created_at"),
+            })
+    except Exception as e:
+        logger.warning(f"Failed to save fetch checkpoint for '{product_name}': {e}")
+
+def _capture_end(pages, fetch: dict):
+    """Pass the pages through, keeping what the generator returns in fetch["until_id"]."""
+    fetch["until_id"] = yield from pages
+
+def record_run(metrics: dict, timings: dict):
+    """Add a finished run's counts and stage timings to the process telemetry."""
+    for stage, seconds in timings.items():
+        PIPELINE_STAGE_SECONDS.observe(seconds, stage=stage)
+    for key, value in metrics.items():
+        if key != 'time_taken' and value:
+            PIPELINE_ITEMS.inc(value, metric=key)
+
 def execute_workflow(
     product_name: str,
     product_description: str,
@@ -17,87 +348,208 @@ def execute_workflow(
     max_tweets: int = 5,
     board_id: str = None,
     board_name: str = "Product Development",
-    list_name: str = "Social Media"
+    list_name: str = "Social Media",
+    on_progress=None,
+    task_id: str = None
 ):
+    """
+    Run the fetch, classify and card creation stages for one product.
+
+    on_progress, if given, is called with a snapshot of the metrics as the run advances.
+    The result carries the seconds spent per stage in "timings".
+
+    With FETCH_CHECKPOINTS_ENABLED, tweets are fetched newest first from where the last run
+    stopped, and the checkpoint only moves once every fetched tweet was classified and, when
+    it needed one, given a card. A run with failures leaves it, so the next run fetches those
+    tweets again.
+
+    With task_id, per-tweet progress is saved on the task document: a rerun of the task
+    skips tweets an earlier attempt finished ("skipped_tweets") and creates the cards it
+    classified without classifying them again ("resumed_tweets"). A rate limit hit after
+    the first page is then raised once the fetched tweets are done, so the task is retried
+    for the rest instead of ending with a failure. Likewise, when tweets failed
+    classification or card creation, e.g. during a Gemini or Trello outage, IncompleteRun is
+    raised so the task retries them.
+    """
     start_time = time.time()
     metrics = {
         'time_taken': 0.0,
         'processed_tweets': 0,
         'cards_added': 0,
         'classification_errors': 0,
-        'trello_errors': 0
+        'trello_errors': 0,
+        'classification_cache_hits': 0,
+        'classification_cache_misses': 0,
+        'duplicates_merged': 0,
+        'prefiltered_tweets': 0,
+        'duplicate_cards_skipped': 0,
+        'cards_in_progress': 0,
+        'resumed_tweets': 0,
+        'skipped_tweets': 0
     }
-    
+    counter = MetricsCounter(metrics, on_progress)
+
+    def finish(outcome: dict) -> dict:
+        metrics['time_taken'] = time.time() - start_time
+        counter.add_time('total', metrics['time_taken'])
+        # The last changes may fall within PROGRESS_INTERVAL of the previous report.
+        counter.report(force=True)
+        return {**outcome, "metrics": metrics, "timings": dict(counter.timings)}
+
     result = {
         "success": True,
         "error": None,
-        "stage": None,
-        "metrics": metrics
+        "stage": None
     }
+    progress = None
 
     try:
-        # Step 1: Fetch Tweets
-        tweets = fetch_tweets(product_name, time_period, max_tweets)
-        if not tweets.get('success'):
-            metrics['time_taken'] = time.time() - start_time
-            return {
-                "success": False,
-                "error": tweets.get("error", "Unknown error"),
-                "stage": "Fetching Tweets",
-                "metrics": metrics
-            }
-        if not tweets.get('tweets'):
-            metrics['time_taken'] = time.time() - start_time
-            return {**result, "message": "No tweets found"}
-        
-        tweets = tweets['tweets']
-        if isinstance(tweets, dict) and tweets.get("success") == False:
-            metrics['time_taken'] = time.time() - start_time
-            return {
+        # Step 1: Fetch Tweets page by page, only those newer than the last run's when possible
+        with counter.timed('fetch'):
+            checkpoint, since_id, until_id = None, None, None
+            sort_order = "relevancy"
+            if settings.FETCH_CHECKPOINTS_ENABLED:
+                checkpoint, since_id, until_id = checkpoint_window(product_name, time_period)
+                # Resuming from an id only skips nothing when the results come newest first.
+                sort_order = "recency"
+            fetch = {"until_id": None}
+            pages = _capture_end(
+                iter_coordinated_pages(product_name, time_period, max_tweets, since_id=since_id, until_id=until_id, sort_order=sort_order),
+                fetch,
+            )
+            try:
+                first_page = next(pages, None)
+            except (RateLimitExceeded, SoftTimeLimitExceeded):
+                # Nothing has been done yet; let the task be retried once the budget resets,
+                # or fail as timed out.
+                raise
+            except Exception as e:
+                return finish({
+                    "success": False,
+                    "error": str(e),
+                    "stage": "Fetching Tweets"
+                })
+        if not first_page:
+            if settings.FETCH_CHECKPOINTS_ENABLED:
+                save_checkpoint(product_name, checkpoint, until_id, None, fetch["until_id"])
+            return finish({**result, "message": "No tweets found"})
+
+        # Step 2: Classify tweets in batches on a bounded pool as pages arrive, feeding
+        # Step 3: a card writer that creates queued cards in bulk, TRELLO_CONCURRENCY at a time.
+        card_queue = queue.Queue(maxsize=max(1, settings.TRELLO_QUEUE_SIZE))
+        batch_size = max(1, settings.GEMINI_BATCH_SIZE)
+        classify_workers = max(1, settings.GEMINI_CONCURRENCY)
+        newest = None
+        fetch_error = None
+        dedup = DedupIndex(product_name) if settings.DEDUP_ENABLED else None
+        if task_id:
+            try:
+                progress = TaskProgress(task_id)
+            except Exception as e:
+                logger.warning(f"Failed to load progress of task {task_id}, starting over: {e}")
+        prefilter = None
+        if settings.PREFILTER_ENABLED:
+            with counter.timed('prefilter'):
+                prefilter = Prefilter(product_name)
+
+        with ThreadPoolExecutor(max_workers=1, thread_name_prefix="trello") as writers:
+            writer_future = writers.submit(card_writer, card_queue, counter, trello_api_key, trello_token, list_name, board_id, board_name, progress)
+            try:
+                # At most two batches per worker are in flight; fetching the next page
+                # waits here, so memory stays bounded by the page size.
+                in_flight = threading.BoundedSemaphore(classify_workers * 2)
+                with ThreadPoolExecutor(max_workers=classify_workers, thread_name_prefix="gemini") as classifiers:
+                    classify_futures = []
+                    fetched = 0
+                    page = first_page
+                    while page:
+                        newest = newer_tweet(newest, page)
+                        fetched_page = len(page)
+                        if progress:
+                            # First, so tweets an earlier attempt finished are not taken for duplicates
+                            # of the dedup records it left.
+                            page, resumed_cards, done = progress.resume(page)
+                            counter.incr('skipped_tweets', done)
+                            counter.incr('resumed_tweets', len(resumed_cards))
+                            for card in resumed_cards:
+                                card_queue.put(card)
+                        if dedup:
+                            with counter.timed('dedup'):
+                                page = dedup.filter_page(page)
+                            counter.incr('duplicates_merged', dedup.merged - metrics['duplicates_merged'])
+                        if prefilter:
+                            # Only tweets that need a Gemini decision go on to classification.
+                            with counter.timed('prefilter'):
+                                page = prefilter.filter_page(page)
+                            counter.incr('prefiltered_tweets', prefilter.rejected - metrics['prefiltered_tweets'])
+                        for start in range(0, len(page), batch_size):
+                            batch = {
+                                post_id(tweet, fetched + start + offset): tweet
+                                for offset, tweet in enumerate(page[start:start + batch_size])
+                            }
+                            in_flight.acquire()
+                            future = classifiers.submit(classify_stage, batch, prioritization_rule, product_description, card_queue, counter, product_name, progress)
+                            future.add_done_callback(lambda _: in_flight.release())
+                            classify_futures.append(future)
+                        fetched += fetched_page
+                        try:
+                            with counter.timed('fetch'):
+                                page = next(pages, None)
+                        except SoftTimeLimitExceeded:
+                            # Stop fetching; the batches in flight and their cards still finish.
+                            raise
+                        except Exception as e:
+                            # Finish what was already fetched, then report the failure.
+                            fetch_error = e
+                            page = None
+                    for future in classify_futures:
+                        future.result()
+            finally:
+                card_queue.put(_STOP)
+            writer_future.result()
+
+        if fetch_error:
+            if progress and isinstance(fetch_error, RateLimitExceeded):
+                # The task is retried and resumes after what was done here.
+                raise fetch_error
+            return finish({
                 "success": False,
-                "error": tweets.get("error", "Unknown error"),
-                "stage": "Fetching Tweets",
-                "metrics": metrics
-            }
+                "error": str(fetch_error),
+                "stage": "Fetching Tweets"
+            })
 
-        # Step 2: Process Tweets
-        for tweet in tweets:
-            metrics['processed_tweets'] += 1
-            classification = post_to_card(tweet, prioritization_rule, product_description)
-            
-            if classification["success"]:
-                card = classification["result"]
-                if card.get("add", False):
-                    # Step 3: Add Card to Trello
-                    add_response = add_trello_card(
-                        trello_api_key,
-                        trello_token,
-                        list_name,
-                        card["priority"],
-                        card["card_name"],
-                        card["card_description"],
-                        board_id,
-                        board_name
-                    )
-                    
-                    if add_response["success"]:
-                        metrics['cards_added'] += 1
-                        logger.info(f"Added card '{card['card_name']}' to Trello.")
-                    else:
-                        metrics['trello_errors'] += 1
-                        logger.error(f"Failed to add card '{card['card_name']}': {add_response['error']}")
-            else:
-                metrics['classification_errors'] += 1
-                logger.error(f"Classification failed for tweet: {classification['error']}")
+        if dedup:
+            with counter.timed('dedup'):
+                # Failed tweets stay unrecorded, so the run that retries them does not drop them as seen.
+                dedup.commit(lambda tweet: card_ledger.source_key(tweet) not in counter.failed)
+        if prefilter and prefilter.rejected:
+            logger.info(f"Prefilter skipped {prefilter.rejected} tweets: {dict(prefilter.reasons)}")
+        if counter.failed:
+            error = f"{len(counter.failed)} tweets could not be classified or carded."
+            logger.warning(f"Run of '{product_name}' left tweets unprocessed, keeping its fetch checkpoint: {error}")
+            outcome = finish({"success": False, "error": error, "stage": "Processing Tweets"})
+            if task_id:
+                retry_after = settings.WORKFLOW_INCOMPLETE_RETRY_DELAY
+                if metrics['cards_in_progress']:
+                    # A reservation left by a failed attempt can only be taken over once its lease runs out.
+                    retry_after = max(retry_after, settings.CARD_LEDGER_LEASE + 1)
+                raise IncompleteRun(error, outcome, retry_after)
+            return outcome
+        if settings.FETCH_CHECKPOINTS_ENABLED:
+            save_checkpoint(product_name, checkpoint, until_id, newest, fetch["until_id"])
 
-        metrics['time_taken'] = time.time() - start_time
-        return {**result, "message": "Workflow executed successfully"}
+        return finish({**result, "message": "Workflow executed successfully"})
 
+    except (RateLimitExceeded, SoftTimeLimitExceeded, IncompleteRun):
+        # Left to the task: it requeues rate-limited and incomplete runs and fails timed out ones.
+        raise
     except Exception as e:
-        metrics['time_taken'] = time.time() - start_time
-        return {
+        return finish({
             "success": False,
             "error": str(e),
-            "stage": "Unknown",
-            "metrics": metrics
-        }
\ No newline at end of file
+            "stage": "Unknown"
+        })
+    finally:
+        if progress:
+            progress.flush()
+        record_run(metrics, counter.timings)
@@ -0,0 +1,273 @@
+import logging
+import math
+import os
+import random
+import re
+import threading
+import zlib
+from collections import Counter
+from datetime import datetime, timedelta
+from pymongo import DESCENDING
+from app.core.config import settings
+from app.database import get_db
+from app.services import classification_cache
+from app.services.dedup import normalize
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+def get_collection():
+    return get_db().prefilter_models
+
+# X marks posts without classifiable text with these codes instead of a language.
+UNDETERMINED_LANGUAGES = {"und", "zxx", "art", "qam", "qct", "qht", "qme", "qst"}
+ENGAGEMENT_FIELDS = ("likes", "retweets", "replies")
+
+# Hashed word unigrams and bigrams; 2^18 buckets keep collisions rare at our vocabulary size.
+NUM_BUCKETS = 1 << 18
+MAX_STORED_WEIGHTS = 50_000
+TRAINING_EPOCHS = 5
+LEARNING_RATE = 0.1
+L2 = 1e-6
+HOLDOUT_SHARE = 0.2
+MIN_HOLDOUT_POSITIVES = 10
+
+_URL = re.compile(r"https?://\S+")
+_TAG = re.compile(r"[@#]\w+")
+_WORD = re.compile(r"[^\W\d_]{2,}")
+
+_models = {}
+_models_lock = threading.Lock()
+# Products whose model is being trained by a background thread of this process.
+_training = set()
+
+def _reset_training():
+    # Training threads do not survive a fork; the child starts its own.
+    global _models_lock
+    _models_lock = threading.Lock()
+    _training.clear()
+
+os.register_at_fork(after_in_child=_reset_training)
+
+def allowed_languages() -> set:
+    return {lang.strip().lower() for lang in settings.PREFILTER_LANGUAGES.split(",") if lang.strip()}
+
+def _engagement(tweet: dict) -> int:
+    return sum(value for value in (tweet.get(field, 0) for field in ENGAGEMENT_FIELDS) if isinstance(value, int))
+
+def rule_reason(tweet: dict, languages: set):
+    """Return why a local rule rejects the tweet, or None if it should be classified."""
+    lang = (tweet.get("lang") or "").lower()
+    if languages and lang and lang not in UNDETERMINED_LANGUAGES and lang not in languages:
+        return "language"
+    text = tweet.get("text") or ""
+    if not _WORD.search(_TAG.sub(" ", _URL.sub(" ", text))):
+        return "link_only"
+    if _engagement(tweet) == 0 and len(_TAG.findall(text)) >= settings.PREFILTER_SPAM_MIN_TAGS:
+        return "spam"
+    return None
+
+def features(text: str) -> list:
+    """Hashed buckets of the normalized text's words and word pairs."""
+    words = normalize(text).split()
+    grams = [f"1:{word}" for word in words] + [f"2:{a} {b}" for a, b in zip(words, words[1:])]
+    return sorted({zlib.crc32(gram.encode()) % NUM_BUCKETS for gram in grams})
+
+def _sigmoid(value: float) -> float:
+    if value < -35:
+        return 0.0
+    return 1.0 / (1.0 + math.exp(-value))
+
+class TextModel:
+    """Logistic regression over hashed n-grams, predicting whether Gemini would add a tweet."""
+
+    def __init__(self, weights: dict = None, bias: float = 0.0):
+        self.weights = weights or {}
+        self.bias = bias
+
+    def predict(self, text: str) -> float:
+        return _sigmoid(self.bias + sum(self.weights.get(bucket, 0.0) for bucket in features(text)))
+
+    @classmethod
+    def train(cls, samples: list) -> "TextModel":
+        """
+        Fit on (bucket list, added) pairs with SGD. Added tweets are rare, so both classes
+        are weighted to contribute equally.
+        """
+        positives = sum(1 for _, added in samples if added)
+        negatives = len(samples) - positives
+        class_weight = {True: len(samples) / (2 * positives), False: len(samples) / (2 * negatives)}
+        model = cls()
+        order = list(range(len(samples)))
+        rng = random.Random(0)
+        for _ in range(TRAINING_EPOCHS):
+            rng.shuffle(order)
+            for index in order:
+                buckets, added = samples[index]
+                prediction = _sigmoid(model.bias + sum(model.weights.get(bucket, 0.0) for bucket in buckets))
+                step = LEARNING_RATE * class_weight[added] * ((1.0 if added else 0.0) - prediction)
+                model.bias += step
+                for bucket in buckets:
+                    weight = model.weights.get(bucket, 0.0)
+                    model.weights[bucket] = weight + step - LEARNING_RATE * L2 * weight
+        if len(model.weights) > MAX_STORED_WEIGHTS:
+            kept = sorted(model.weights.items(), key=lambda item: abs(item[1]), reverse=True)[:MAX_STORED_WEIGHTS]
+            model.weights = dict(kept)
+        return model
+
+    def to_document(self) -> dict:
+        return {"weights": {str(bucket): round(weight, 6) for bucket, weight in self.weights.items()}, "bias": self.bias}
+
+    @classmethod
+    def from_document(cls, document: dict) -> "TextModel":
+        return cls({int(bucket): weight for bucket, weight in document["weights"].items()}, document["bias"])
+
+def _training_samples(product_name: str) -> list:
+    classification_cache.ensure_indexes()
+    cursor = (
+        classification_cache.get_collection()
+        .find(
+            {"product_name": product_name, "text": {"$exists": True}, "result.success": True},
+            {"text": 1, "result.result.add": 1},
+        )
+        .sort("created_at", DESCENDING)
+        .limit(settings.PREFILTER_TRAINING_LIMIT)
+    )
+    return [(doc["text"], bool(doc["result"]["result"].get("add"))) for doc in cursor]
+
+def train_model(product_name: str):
+    """
+    Train the product's classifier on cached Gemini decisions and store it.
+
+    A held-out share of the decisions checks how many tweets Gemini added would have been
+    rejected; the classifier is only enabled when that stays within PREFILTER_MAX_MISSED.
+
+    Returns:
+        dict: The stored model document, or None when there is too little data.
+    """
+    samples = _training_samples(product_name)
+    positives = sum(1 for _, added in samples if added)
+    if len(samples) < settings.PREFILTER_MIN_TRAINING_SAMPLES or not 0 < positives < len(samples):
+        return None
+
+    # Split by text hash so the same tweet never lands on both sides.
+    held_out = lambda text: zlib.crc32(text.encode()) % 100 < HOLDOUT_SHARE * 100
+    train = [(features(text), added) for text, added in samples if not held_out(text)]
+    test = [(text, added) for text, added in samples if held_out(text)]
+    if not any(added for _, added in train) or all(added for _, added in train):
+        return None
+    model = TextModel.train(train)
+
+    threshold = settings.PREFILTER_REJECT_BELOW
+    scores = [(model.predict(text), added) for text, added in test]
+    test_positives = [score for score, added in scores if added]
+    test_negatives = [score for score, added in scores if not added]
+    missed = sum(score < threshold for score in test_positives) / len(test_positives) if test_positives else 1.0
+    rejected = sum(score < threshold for score in test_negatives) / len(test_negatives) if test_negatives else 0.0
+    enabled = len(test_positives) >= MIN_HOLDOUT_POSITIVES and missed <= settings.PREFILTER_MAX_MISSED
+
+    document = {
+        **model.to_document(),
+        "trained_at": datetime.utcnow(),
+        "samples": len(samples),
+        "positives": positives,
+        "threshold": threshold,
+        "held_out": {"missed": missed, "rejected": rejected, "size": len(test)},
+        "enabled": enabled,
+    }
+    get_collection().replace_one({"_id": product_name}, document, upsert=True)
+    logger.info(
+        f"Trained prefilter for '{product_name}' on {len(samples)} decisions: "
+        f"held out, it rejects {rejected:.1%} of skipped tweets and {missed:.1%} of added ones "
+        f"({'enabled' if enabled else 'disabled'})."
+    )
+    return document
+
+def _usable(document: dict):
+    if document is None or not document.get("enabled"):
+        return None, None
+    return TextModel.from_document(document), document.get("threshold")
+
+def _train_in_background(product_name: str):
+    """Start training the product's model on a thread, unless it already is. Called under _models_lock."""
+    if product_name in _training:
+        return
+    _training.add(product_name)
+
+    def run():
+        try:
+            document = train_model(product_name)
+        except Exception as e:
+            logger.warning(f"Failed to train prefilter for '{product_name}': {e}")
+            document = None
+        with _models_lock:
+            _training.discard(product_name)
+            if document is not None:
+                _models[product_name] = (document["trained_at"], *_usable(document))
+
+    threading.Thread(target=run, name=f"prefilter-train-{product_name}", daemon=True).start()
+
+def load_model(product_name: str):
+    """
+    Return the product's enabled TextModel and its threshold, or (None, None) when it is
+    not usable.
+
+    A model missing or older than PREFILTER_RETRAIN_INTERVAL is retrained on a background
+    thread. Meanwhile the stored model, if any, keeps being used, and without one only the
+    rules apply.
+    """
+    stale_before = datetime.utcnow() - timedelta(seconds=settings.PREFILTER_RETRAIN_INTERVAL)
+    with _models_lock:
+        cached = _models.get(product_name)
+        if cached and cached[0] >= stale_before:
+            return cached[1], cached[2]
+
+        document = get_collection().find_one({"_id": product_name})
+        fresh = document is not None and document["trained_at"] >= stale_before
+        if not fresh:
+            _train_in_background(product_name)
+        model, threshold = _usable(document)
+        # Without a fresh model, the next check waits a full interval too, unless training stores one first.
+        checked_at = document["trained_at"] if fresh else datetime.utcnow()
+        _models[product_name] = (checked_at, model, threshold)
+        return model, threshold
+
+class Prefilter:
+    """
+    Drops tweets that clearly need no Gemini call, before classification.
+
+    Local rules reject tweets in other languages than PREFILTER_LANGUAGES, tweets with
+    only links, mentions and hashtags, and tag-stuffed tweets nobody engaged with. When
+    PREFILTER_CLASSIFIER_ENABLED, the product's text classifier then rejects tweets it
+    gives less than its threshold chance of being added.
+    """
+
+    def __init__(self, product_name: str):
+        self.product_name = product_name
+        self.languages = allowed_languages()
+        self.rejected = 0
+        self.reasons = Counter()
+        self.model, self.threshold = None, None
+        if settings.PREFILTER_CLASSIFIER_ENABLED:
+            try:
+                self.model, self.threshold = load_model(product_name)
+            except Exception as e:
+                logger.warning(f"Prefilter classifier unavailable for '{product_name}': {e}")
+
+    def reason(self, tweet: dict):
+        reason = rule_reason(tweet, self.languages)
+        if reason is None and self.model is not None and self.model.predict(tweet.get("text") or "") < self.threshold:
+            reason = "classifier"
+        return reason
+
+    def filter_page(self, tweets: list) -> list:
+        """Return the tweets that should still be classified, counting the rejected ones."""
+        kept = []
+        for tweet in tweets:
+            reason = self.reason(tweet)
+            if reason is None:
+                kept.append(tweet)
+            else:
+                self.rejected += 1
+                self.reasons[reason] += 1
+        return kept
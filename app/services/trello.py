@@ -1,4 +1,135 @@
+import hashlib
+import json
+import re
+import threading
+import time
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlparse
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import NewConnectionError
+from app.core.config import settings
+from app.services import card_ledger
+from app.utils.rate_limit import get_bucket
+from app.utils.redis_utils import get_redis
+from app.utils.telemetry import EXTERNAL_CALL_ERRORS, external_call
+
+# Resolved (board_id, list_id) pairs keyed by destination, with their expiry time.
+_destinations = {}
+_destinations_lock = threading.Lock()
+_resolution_locks = {}
+
+_client = None
+_client_lock = threading.Lock()
+
+# Trello ids are 24 hex characters; they are replaced in metric labels to keep them bounded.
+_TRELLO_ID = re.compile(r"/[0-9a-f]{24}(?=/|$)")
+
+class TrelloClient:
+    """
+    Trello HTTP client on a shared, pooled keep-alive session.
+
+    Responses with status 429 are retried for every method, honouring Retry-After,
+    since Trello did not process the request. 5xx responses and dropped connections
+    are retried for GET only, as a failed POST may still have created the card.
+
+    Every attempt first takes a token from the per-API-key and per-token buckets, which
+    mirror Trello's own limits, so bursts queue locally instead of collecting 429s.
+    """
+
+    RETRY_BACKOFF = 0.5
+    MAX_BACKOFF = 30.0
+
+    def __init__(self, pool_size: int = None, timeout: float = None, max_retries: int = None):
+        self.timeout = timeout or settings.TRELLO_TIMEOUT
+        self.max_retries = settings.TRELLO_MAX_RETRIES if max_retries is None else max_retries
+        pool_size = pool_size or settings.TRELLO_POOL_SIZE
+
+        self.session = requests.Session()
+        # pool_block keeps concurrent card writers from opening throwaway connections
+        # beyond pool_size; they wait for a pooled one instead.
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, pool_block=True)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def request(self, method: str, url: str, **kwargs) -> requests.Response:
+        kwargs.setdefault("timeout", self.timeout)
+        params = kwargs.get("params") or {}
+        operation = f"{method} {_TRELLO_ID.sub('/{id}', urlparse(url).path)}"
+        attempt = 0
+        while True:
+            self._throttle(params.get("key"), params.get("token"))
+            try:
+                with external_call("trello", operation):
+                    response = self.session.request(method, url, **kwargs)
+                if response.status_code >= 400:
+                    EXTERNAL_CALL_ERRORS.inc(service="trello", operation=operation)
+            except requests.exceptions.ConnectionError as e:
+                # Only a failed connect proves a POST never reached Trello.
+                retryable = method == "GET" or isinstance(e, requests.exceptions.ConnectTimeout)
+                if attempt >= self.max_retries or not retryable:
+                    raise
+                delay = self._backoff(attempt)
+            else:
+                if attempt >= self.max_retries or not self._should_retry(method, response):
+                    return response
+                delay = self._retry_after(response) or self._backoff(attempt)
+                response.close()
+            attempt += 1
+            print(f"Trello {method} {url.split('?')[0]} will be retried in {delay:.1f}s (attempt {attempt}/{self.max_retries}).")
+            time.sleep(delay)
+
+    def get(self, url: str, **kwargs) -> requests.Response:
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url: str, **kwargs) -> requests.Response:
+        return self.request("POST", url, **kwargs)
+
+    @staticmethod
+    def _throttle(api_key: str = None, token: str = None):
+        window = 10.0
+        if api_key:
+            limit = settings.TRELLO_KEY_REQUESTS_PER_10S
+            get_bucket(f"trello:key:{_hash(api_key)}", limit / window, limit).acquire()
+        if token:
+            limit = settings.TRELLO_TOKEN_REQUESTS_PER_10S
+            get_bucket(f"trello:token:{_hash(token)}", limit / window, limit).acquire()
+
+    @staticmethod
+    def _should_retry(method: str, response: requests.Response) -> bool:
+        if response.status_code == 429:
+            return True
+        return method == "GET" and response.status_code >= 500
+
+    def _backoff(self, attempt: int) -> float:
+        return min(self.MAX_BACKOFF, self.RETRY_BACKOFF * 2 ** attempt)
+
+    def _retry_after(self, response: requests.Response):
+        retry_after = response.headers.get("Retry-After")
+        if not retry_after:
+            return None
+        try:
+            delay = float(retry_after)
+        except ValueError:
+            try:
+                delay = parsedate_to_datetime(retry_after).timestamp() - time.time()
+            except (TypeError, ValueError):
+                return None
+        return min(self.MAX_BACKOFF, max(0.0, delay))
+
+def _hash(secret: str) -> str:
+    return hashlib.sha256(secret.encode()).hexdigest()[:16]
+
+def get_client() -> TrelloClient:
+    """Return the process-wide TrelloClient, creating it on first use."""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = TrelloClient()
+    return _client
 
 def get_or_create_board(api_key, token, board_id=None, board_name=None):
     """
@@ -7,15 +138,18 @@ def get_or_create_board(api_key, token, board_id=None, board_name=None):
     If no matching board is found, create a new board with that name.
     """
 
+    if board_id:
+        return board_id
+
     if board_name:
         # Search for board by name among the user's boards.
-        url = "https://api.trello.com/1/members/me/boards"
+        url = f"{settings.TRELLO_API_URL}/members/me/boards"
         params = {
             'key': api_key,
             'token': token,
             'fields': 'name'
         }
-        response = requests.get(url, params=params)
+        response = get_client().get(url, params=params)
         response.raise_for_status()
         boards = response.json()
         for board in boards:
@@ -24,14 +158,14 @@ def get_or_create_board(api_key, token, board_id=None, board_name=None):
                 return board['id']
         # If not found, create a new board without default lists.
         print(f"Board '{board_name}' not found. Creating new board...")
-        create_url = "https://api.trello.com/1/boards"
+        create_url = f"{settings.TRELLO_API_URL}/boards"
         create_params = {
             'name': board_name,
             'defaultLists': 'false',
             'key': api_key,
             'token': token
         }
-        create_response = requests.post(create_url, params=create_params)
+        create_response = get_client().post(create_url, params=create_params)
         create_response.raise_for_status()
         new_board = create_response.json()
         print(f"Created board '{board_name}' with id {new_board['id']}.")
@@ -53,12 +187,12 @@ def get_or_create_list(api_key, token, board_id, list_name):
         str: The ID of the found or newly created list.
     """
     # URL to get all lists on the board.
-    url = f"https://api.trello.com/1/boards/{board_id}/lists"
+    url = f"{settings.TRELLO_API_URL}/boards/{board_id}/lists"
     params = {
         'key': api_key,
         'token': token
     }
-    response = requests.get(url, params=params)
+    response = get_client().get(url, params=params)
     response.raise_for_status()
     lists = response.json()
     
@@ -70,20 +204,167 @@ def get_or_create_list(api_key, token, board_id, list_name):
     
     # If not found, create the list.
     print(f"List '{list_name}' not found. Creating new list...")
-    create_url = "https://api.trello.com/1/lists"
+    create_url = f"{settings.TRELLO_API_URL}/lists"
     create_params = {
         'name': list_name,
         'idBoard': board_id,
         'key': api_key,
         'token': token
     }
-    create_response = requests.post(create_url, params=create_params)
+    create_response = get_client().post(create_url, params=create_params)
     create_response.raise_for_status()
     new_list = create_response.json()
     print(f"Created list '{list_name}' with id {new_list['id']}.")
     return new_list['id']
 
-def create_trello_ticket_with_priority(api_key: str, token: str, board_id: str, list_name: str, card_name: str, priority: str, description: str = ""):
+def _destination_key(token: str, list_name: str, board_id: str = None, board_name: str = None) -> str:
+    # The token is hashed so it never ends up in Redis keys.
+    board = f"id:{board_id}" if board_id else f"name:{board_name}"
+    return f"trello:destination:{_hash(token)}:{board}:{list_name}"
+
+def _cached_destination(key: str):
+    with _destinations_lock:
+        cached = _destinations.get(key)
+    if cached and cached[1] > time.time():
+        return cached[0]
+
+    redis_client = get_redis()
+    if redis_client is not None:
+        try:
+            value = redis_client.get(key)
+        except Exception as e:
+            print(f"Trello destination cache unavailable: {e}")
+            value = None
+        if value:
+            destination = tuple(json.loads(value))
+            with _destinations_lock:
+                _destinations[key] = (destination, time.time() + settings.TRELLO_DESTINATION_TTL)
+            return destination
+    return None
+
+def _store_destination(key: str, destination: tuple):
+    with _destinations_lock:
+        _destinations[key] = (destination, time.time() + settings.TRELLO_DESTINATION_TTL)
+    redis_client = get_redis()
+    if redis_client is not None:
+        try:
+            redis_client.set(key, json.dumps(destination), ex=settings.TRELLO_DESTINATION_TTL)
+        except Exception as e:
+            print(f"Trello destination cache unavailable: {e}")
+
+@contextmanager
+def _resolution_guard(key: str):
+    """
+    Serialize resolution of one destination, within the process and across processes
+    sharing Redis, so concurrent runs don't each create the same board or list.
+    """
+    with _destinations_lock:
+        local_lock = _resolution_locks.setdefault(key, threading.Lock())
+    with local_lock:
+        redis_client = get_redis()
+        if redis_client is None:
+            yield
+            return
+        redis_lock = redis_client.lock(f"{key}:lock", timeout=60, blocking_timeout=60)
+        try:
+            acquired = redis_lock.acquire()
+        except Exception as e:
+            print(f"Trello resolution lock unavailable: {e}")
+            acquired = False
+        try:
+            yield
+        finally:
+            if acquired:
+                try:
+                    redis_lock.release()
+                except Exception:
+                    pass
+
+def resolve_destination(api_key: str, token: str, list_name: str, board_id: str = None, board_name: str = None):
+    """
+    Resolve the board and list a card should go to, creating them if needed.
+
+    Results are cached per (token, board, list) for TRELLO_DESTINATION_TTL seconds, in process
+    and in Redis when REDIS_URL is set, so a run resolves its destination once rather than
+    once per card.
+
+    Returns:
+        tuple: (board_id, list_id)
+    """
+    key = _destination_key(token, list_name, board_id, board_name)
+    destination = _cached_destination(key)
+    if destination:
+        return destination
+
+    with _resolution_guard(key):
+        # Another thread or worker may have resolved it while we waited for the guard.
+        destination = _cached_destination(key)
+        if destination:
+            return destination
+        resolved_board_id = get_or_create_board(api_key, token, board_id=board_id, board_name=board_name)
+        list_id = get_or_create_list(api_key, token, resolved_board_id, list_name)
+        destination = (resolved_board_id, list_id)
+        _store_destination(key, destination)
+        return destination
+
+def invalidate_destination(token: str, list_name: str, board_id: str = None, board_name: str = None):
+    """Drop a cached destination, e.g. after Trello reports the board or list no longer exists."""
+    key = _destination_key(token, list_name, board_id, board_name)
+    with _destinations_lock:
+        _destinations.pop(key, None)
+    redis_client = get_redis()
+    if redis_client is not None:
+        try:
+            redis_client.delete(key)
+        except Exception as e:
+            print(f"Trello destination cache unavailable: {e}")
+
+def create_card(api_key: str, token: str, list_id: str, card_name: str, priority: str, description: str = ""):
+    """
+    Create a Trello card in the given list, with the priority prepended to its name.
+
+    Returns:
+        dict: The JSON response from the Trello API with details about the created card.
+
+    Raises:
+        requests.exceptions.HTTPError: If Trello rejects the request.
+    """
+    # Prepend the priority to the card name.
+    card_name_with_priority = f"[{priority}] {card_name}"
+
+    # URL to create a new card.
+    create_card_url = f"{settings.TRELLO_API_URL}/cards"
+    card_params = {
+        'key': api_key,
+        'token': token,
+        'idList': list_id,
+        'name': card_name_with_priority
+    }
+    if description:
+        card_params['desc'] = description
+
+    response = get_client().post(create_card_url, params=card_params)
+    response.raise_for_status()
+    return response.json()
+
+def _is_not_found(error: Exception) -> bool:
+    response = getattr(error, "response", None)
+    return response is not None and response.status_code == 404
+
+def _may_have_created(error: Exception) -> bool:
+    # Trello rejected the request (4xx), or the connection was never made: either way no card
+    # exists. After a 5xx, a dropped connection or a read timeout, it may have been created.
+    response = getattr(error, "response", None)
+    if response is not None:
+        return not 400 <= response.status_code < 500
+    if isinstance(error, requests.exceptions.ConnectTimeout):
+        return False
+    if isinstance(error, requests.exceptions.ConnectionError):
+        reason = getattr(error.args[0], "reason", None) if error.args else None
+        return not isinstance(reason, NewConnectionError)
+    return isinstance(error, requests.exceptions.RequestException)
+
+def create_trello_ticket_with_priority(api_key: str, token: str, board_id: str, list_name: str, card_name: str, priority: str, description: str = "", source_key: str = None):
     """
     Create a Trello card in the specified list. The card's name will include the given priority.
     
@@ -95,32 +376,43 @@ def create_trello_ticket_with_priority(api_key: str, token: str, board_id: str,
         card_name (str): The base name for the card.
         priority (str): The priority level (e.g., "High", "Medium", "Low").
         card_desc (str, optional): A description for the card.
+        source_key (str, optional): The tweet id or content hash the card comes from (see
+            card_ledger.source_key). At most one card is created per source and list.
     
     Returns:
         dict: The JSON response from the Trello API with details about the created card.
     """
-    try:
-        # Get or create the list on the board.
-        list_id = get_or_create_list(api_key, token, board_id, list_name)
-        
-        # Prepend the priority to the card name.
-        card_name_with_priority = f"[{priority}] {card_name}"
-        
-        # URL to create a new card.
-        create_card_url = "https://api.trello.com/1/cards"
-        card_params = {
-            'key': api_key,
-            'token': token,
-            'idList': list_id,
-            'name': card_name_with_priority
-        }
-        if description:
-            card_params['desc'] = description
+    return _add_card(api_key, token, list_name, priority, card_name, description, board_id=board_id, source_key=source_key)
 
-        response = requests.post(create_card_url, params=card_params)
-        response.raise_for_status()
-        return {"success": True, "card": response.json()}
+def _add_card(api_key: str, token: str, list_name: str, priority: str, card_name: str, card_desc: str, board_id: str = None, board_name: str = None, source_key: str = None):
+    key = reservation = None
+    try:
+        resolved_board_id, list_id = resolve_destination(api_key, token, list_name, board_id=board_id, board_name=board_name)
+        if source_key and settings.CARD_LEDGER_ENABLED:
+            # Keyed by the list itself, so every token and board reference to it shares the entry.
+            key = card_ledger.ledger_key(f"{resolved_board_id}:{list_id}", source_key)
+            reservation = card_ledger.reserve(key)
+            if reservation is not None and not reservation["reserved"]:
+                if reservation["card"] is None:
+                    # Another run holds the reservation; the card is left for a retry to settle.
+                    return {"success": False, "error": "Card creation for this tweet is in progress elsewhere.", "in_progress": True}
+                return {"success": True, "card": reservation["card"], "duplicate": True}
+        try:
+            card = create_card(api_key, token, list_id, card_name, priority, card_desc)
+        except requests.exceptions.HTTPError as err:
+            if not _is_not_found(err):
+                raise
+            # The cached board or list was deleted; resolve it again and retry once.
+            invalidate_destination(token, list_name, board_id=board_id, board_name=board_name)
+            _, list_id = resolve_destination(api_key, token, list_name, board_id=board_id, board_name=board_name)
+            card = create_card(api_key, token, list_id, card_name, priority, card_desc)
+        if reservation is not None:
+            card_ledger.mark_created(key, reservation["owner"], card)
+        return {"success": True, "card": card}
     except Exception as e:
+        # When the card may exist, the reservation is kept until its lease runs out.
+        if reservation is not None and reservation["reserved"] and not _may_have_created(e):
+            card_ledger.release(key, reservation["owner"])
         return {"success": False, "error": str(e)}
 
 def add_trello_card(api_key: str, token: str, list_name: str, priority: str, card_name: str, card_desc: str,  board_id: str = None, board_name: str = None):
@@ -129,9 +421,50 @@ def add_trello_card(api_key: str, token: str, list_name: str, priority: str, car
     if not board_id and not board_name:
         return {"success": False, "error": "Either board_id or board_name must be provided" }
 
-    board_id = get_or_create_board(api_key, token, board_id=board_id, board_name=board_name)
+    return _add_card(api_key, token, list_name, priority, card_name, card_desc, board_id=board_id, board_name=board_name)
+
+def add_trello_cards(cards: list, api_key: str, token: str, list_name: str, board_id: str = None, board_name: str = None, max_workers: int = None):
+    """
+    Create several Trello cards in one list concurrently.
+
+    The destination board and list are resolved once up front, then the cards are posted
+    on up to max_workers threads. Requests are paced by the TrelloClient token buckets.
+
+    Parameters:
+        cards (list): Dicts with "card_name", "priority" and optionally "card_description" and
+            "source_key", the tweet the card comes from; a source that already has a card in
+            the list is not added again.
+        api_key (str): Your Trello API key.
+        token (str): Your Trello token.
+        list_name (str): The name of the list to add the cards to.
+        board_id (str, optional): The ID of the Trello board.
+        board_name (str, optional): The board name, used when board_id is not given.
+        max_workers (int, optional): Concurrent requests. Defaults to settings.TRELLO_CONCURRENCY.
+
+    Returns:
+        list: One {"success": True, "card": {...}} or {"success": False, "error": str} per card, in order.
+              Cards skipped as duplicates also carry "duplicate": True, and cards another run is
+              creating "in_progress": True.
+    """
+    if not cards:
+        return []
+    if not board_id and not board_name:
+        return [{"success": False, "error": "Either board_id or board_name must be provided"} for _ in cards]
+
     try:
-        new_card = create_trello_ticket_with_priority(api_key, token, board_id, list_name, card_name, priority, card_desc)
-        return {"success": True, "card": new_card}
-    except requests.exceptions.HTTPError as err:
-        return {"success": False, "error": str(err)}
\ No newline at end of file
+        resolve_destination(api_key, token, list_name, board_id=board_id, board_name=board_name)
+    except Exception as e:
+        return [{"success": False, "error": str(e)} for _ in cards]
+
+    def add(card):
+        try:
+            return _add_card(
+                api_key, token, list_name, card["priority"], card["card_name"], card.get("card_description", ""),
+                board_id=board_id, board_name=board_name, source_key=card.get("source_key"),
+            )
+        except Exception as e:
+            return {"success": False, "error": str(e)}
+
+    max_workers = max(1, min(len(cards), max_workers or settings.TRELLO_CONCURRENCY))
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="trello-bulk") as pool:
+        return list(pool.map(add, cards))
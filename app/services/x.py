@@ -1,26 +1,152 @@
-import tweepy
 from app.core.config import settings
+from app.utils.rate_limit import RateLimitExceeded, SharedQuota
+from app.utils.redis_utils import get_redis
+from app.utils.telemetry import external_call
 from datetime import datetime, timedelta
+import hashlib
+import logging
+import math
+import os
 import re
+import threading
+import time
 
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
 
-X_BEARER_TOKEN = settings.X_BEARER_TOKEN
+# X resets its app rate limits every 15 minutes.
+RATE_LIMIT_WINDOW = 15 * 60
+SEARCH_RECENT_ROUTE = "/2/tweets/search/recent"
+# 429 responses one request may get before it gives up with RateLimitExceeded.
+MAX_RATE_LIMITED_ATTEMPTS = 3
 
-client = tweepy.Client(bearer_token=X_BEARER_TOKEN, wait_on_rate_limit=False)
+# tweepy always calls this host; requests for it can be redirected with X_API_URL.
+X_DEFAULT_HOST = "https://api.twitter.com"
 
-def fetch_tweets(product: str, time_period: str, max_tweets: int = 10):
+_quotas = {}
+_quotas_lock = threading.Lock()
+
+_client = None
+_client_lock = threading.Lock()
+
+def _reset_client():
+    # The client's pooled connections belong to the parent; each Celery child opens its own.
+    global _client, _client_lock
+    _client = None
+    _client_lock = threading.Lock()
+
+os.register_at_fork(after_in_child=_reset_client)
+
+def _bearer_token() -> str:
+    if not settings.X_BEARER_TOKEN:
+        raise RuntimeError("X_BEARER_TOKEN is not configured.")
+    return settings.X_BEARER_TOKEN
+
+def get_quota(route: str) -> SharedQuota:
+    """Return the shared request budget of the bearer token for one X API route."""
+    token_hash = hashlib.sha256(_bearer_token().encode()).hexdigest()[:16]
+    name = f"x:{token_hash}:{route}"
+    with _quotas_lock:
+        quota = _quotas.get(name)
+        if quota is None:
+            quota = _quotas[name] = SharedQuota(name, RATE_LIMIT_WINDOW, get_redis())
+        return quota
+
+def quota_usage() -> list:
+    """Return the known budget of the search route and any other X API route this process has called."""
+    if not settings.X_BEARER_TOKEN:
+        return []
+    get_quota(SEARCH_RECENT_ROUTE)
+    with _quotas_lock:
+        quotas = list(_quotas.values())
+    return [quota.usage() for quota in quotas]
+
+def _record_rate_limit(quota: SharedQuota, headers):
+    quota.record(
+        limit=headers.get("x-rate-limit-limit"),
+        remaining=headers.get("x-rate-limit-remaining"),
+        reset=headers.get("x-rate-limit-reset"),
+    )
+
+def _build_client():
+    # tweepy is imported here so that importing this module, e.g. for quota_usage in
+    # the API, does not load it.
+    import tweepy
+    from requests.adapters import HTTPAdapter
+
+    class RateLimitedClient(tweepy.Client):
+        """
+        tweepy Client that spends a per-route budget shared by all workers before every request.
+
+        The budget is learned from X's x-rate-limit-* response headers. When it is spent,
+        requests wait for the reset for up to X_RATE_LIMIT_MAX_WAIT seconds and otherwise
+        raise RateLimitExceeded, so the Celery task can be retried after the reset instead
+        of failing. So does a request rejected MAX_RATE_LIMITED_ATTEMPTS times with a 429.
+        """
+
+        def request(self, method, route, params=None, json=None, user_auth=False):
+            quota = get_quota(route)
+            rate_limited = 0
+            while True:
+                quota.reserve(settings.X_RATE_LIMIT_MAX_WAIT)
+                try:
+                    with external_call("x", route):
+                        response = super().request(method, route, params=params, json=json, user_auth=user_auth)
+                except tweepy.TooManyRequests as e:
+                    logger.warning(f"X rate limit hit on {route}.")
+                    rate_limited += 1
+                    _record_rate_limit(quota, e.response.headers)
+                    now = time.time()
+                    # Without a reset header, back off for a minute. A reset that is not ahead of
+                    # our clock, from clock skew or another limit, would refill the budget at
+                    # once, so wait at least a second.
+                    header_reset = e.response.headers.get("x-rate-limit-reset")
+                    reset = max(float(header_reset) if header_reset else now + 60, now + 1)
+                    quota.record(remaining=0, reset=math.ceil(reset))
+                    if rate_limited >= MAX_RATE_LIMITED_ATTEMPTS:
+                        raise RateLimitExceeded(quota.name, reset - now)
+                    continue
+                _record_rate_limit(quota, response.headers)
+                return response
+
+    class RedirectAdapter(HTTPAdapter):
+        """Send requests for one base URL to another, e.g. the offline benchmark stand-in."""
+
+        def __init__(self, source: str, target: str, **kwargs):
+            super().__init__(**kwargs)
+            self.source = source.rstrip("/")
+            self.target = target.rstrip("/")
+
+        def send(self, request, **kwargs):
+            request.url = self.target + request.url[len(self.source):]
+            return super().send(request, **kwargs)
+
+    client = RateLimitedClient(bearer_token=_bearer_token(), wait_on_rate_limit=False)
+    if settings.X_API_URL.rstrip("/") != X_DEFAULT_HOST:
+        client.session.mount(X_DEFAULT_HOST, RedirectAdapter(X_DEFAULT_HOST, settings.X_API_URL))
+    return client
+
+def get_client():
     """
-    Fetch tweets matching the product query from within a given time period.
-    
-    Parameters:
-        product (str): The search query.
-        time_period (str): Time period string like '1d', '30m', '1h' etc.
-        max_tweets (int): Maximum number of tweets to fetch.
-    
-    Returns:
-        List[tweepy.Tweet]: Tweets sorted in descending order of retweet count.
+    Return the process-wide rate limited tweepy Client, creating it on first use.
+
+    Raises:
+        RuntimeError: If X_BEARER_TOKEN is not configured.
+    """
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = _build_client()
+    return _client
+
+def parse_time_period(time_period: str) -> timedelta:
+    """
+    Parse a time period string like '1d', '30m' or '1h' into a timedelta.
+
+    Raises:
+        ValueError: If the string is not in a supported format.
     """
-    # Parse the time period string (e.g., '1d', '30m', '1h')
     match = re.match(r"(\d+)([dhm])", time_period)
     if not match:
         raise ValueError("Invalid time period format. Use formats like '1d', '30m', '1h', etc.")
@@ -29,48 +155,109 @@ def fetch_tweets(product: str, time_period: str, max_tweets: int = 10):
     
     # Determine the appropriate timedelta based on unit
     if unit == "d":
-        delta = timedelta(days=value)
+        return timedelta(days=value)
     elif unit == "h":
-        delta = timedelta(hours=value)
-    elif unit == "m":
-        delta = timedelta(minutes=value)
-    else:
-        return {"success": False, "error": "Unsupported time period unit " + unit + ". Use 'd', 'h', or 'm'."}
+        return timedelta(hours=value)
+    return timedelta(minutes=value)
+
+# X accepts between 10 and 100 results per search request.
+MIN_PAGE_SIZE = 10
+MAX_PAGE_SIZE = 100
+
+def format_tweet(tweet) -> dict:
+    return {
+        "id": str(tweet.id),
+        "text": tweet.text,
+        "retweets": tweet.public_metrics.get('retweet_count', 'NaN'),
+        "replies": tweet.public_metrics.get('reply_count', 'NaN'),
+        "likes": tweet.public_metrics.get('like_count', 'NaN'),
+        "created_at": tweet.created_at,
+        "lang": tweet.lang
+    }
+
+def iter_tweet_pages(product: str, time_period: str, max_tweets: int = 10, since_id: str = None, until_id: str = None, sort_order: str = "relevancy"):
+    """
+    Page through tweets matching the product query, yielding each page as soon as it arrives.
+
+    Pages are requested lazily with next_token, so only one page is held in memory at a
+    time and the caller can start processing before the later pages are downloaded.
+
+    Parameters:
+        product (str): The search query.
+        time_period (str): Time period string like '1d', '30m', '1h' etc.
+        max_tweets (int): Maximum number of tweets to yield across all pages.
+        since_id (str, optional): Only fetch tweets newer than this id. When given,
+            it replaces the time period as the lower bound of the search.
+        until_id (str, optional): Only fetch tweets older than this id.
+        sort_order (str): "relevancy", or "recency" for newest first, which callers that
+            resume from the returned id need.
+
+    Yields:
+        list: Formatted tweets, at most 100 per page.
+
+    Returns:
+        str: When max_tweets cut the search short, the id of the oldest tweet yielded;
+             with recency order, every match newer than it was yielded. None when X had
+             no more matches.
+
+    Raises:
+        ValueError: If time_period is not in a supported format.
+        tweepy.TweepyException: If a page request fails.
+    """
+    # Parse the time period string (e.g., '1d', '30m', '1h')
+    delta = parse_time_period(time_period)
         
     # Calculate the start time (UTC) for the search query
     now = datetime.utcnow()
     start_time = now - delta
     start_time_str = start_time.isoformat("T") + "Z"  # Twitter expects ISO 8601 format
+    window = {"since_id": since_id} if since_id else {"start_time": start_time_str}
+    if until_id:
+        window["until_id"] = until_id
+
+    import tweepy
+
+    page_size = min(MAX_PAGE_SIZE, max(MIN_PAGE_SIZE, max_tweets))
+    paginator = tweepy.Paginator(
+        get_client().search_recent_tweets,
+        query=product,
+        **window,
+        max_results=page_size,
+        sort_order=sort_order,
+        tweet_fields=["public_metrics", "created_at", "lang", "source"]
+    )
+
+    remaining = max_tweets
+    oldest_id = None
+    for response in paginator:
+        if not response.data:
+            break
+        page = [format_tweet(tweet) for tweet in response.data[:remaining]]
+        remaining -= len(page)
+        oldest_id = min([int(tweet["id"]) for tweet in page] + ([oldest_id] if oldest_id else []))
+        yield page
+        if remaining <= 0:
+            return str(oldest_id)
+    return None
+
+def fetch_tweets(product: str, time_period: str, max_tweets: int = 10, since_id: str = None):
+    """
+    Fetch tweets matching the product query from within a given time period.
     
-    # Perform the tweet search; note that in Twitter API v2, use query and start_time parameters.
+    Parameters:
+        product (str): The search query.
+        time_period (str): Time period string like '1d', '30m', '1h' etc.
+        max_tweets (int): Maximum number of tweets to fetch.
+        since_id (str, optional): Only fetch tweets newer than this id. When given,
+            it replaces the time period as the lower bound of the search.
+    
+    Returns:
+        dict: {"success": True, "tweets": [...]} with the formatted tweets, or
+              {"success": False, "error": str} if the search failed.
+    """
+    pages = iter_tweet_pages(product, time_period, max_tweets, since_id=since_id)
     try:
-        tweets_response = client.search_recent_tweets(
-            query=product,
-            start_time=start_time_str,
-            max_results=max_tweets,
-            sort_order="relevancy",
-            tweet_fields=["public_metrics", "created_at", "lang", "source"]
-        )
+        tweets = [tweet for page in pages for tweet in page]
     except Exception as e:
         return {"success": False, "error": str(e)}
-    
-    # If no tweets are found, return an empty list.
-    if tweets_response.data is None:
-        return {"success": True, "tweets": []}
-    
-    tweets = tweets_response.data
-
-    formatted_tweets = []
-    for tweet in tweets:
-        formatted_tweets.append(
-            {
-                "text": tweet.text,
-                "retweets": tweet.public_metrics.get('retweet_count', 'NaN'),
-                "replies": tweet.public_metrics.get('reply_count', 'NaN'),
-                "likes": tweet.public_metrics.get('like_count', 'NaN'),
-                "created_at": tweet.created_at,
-                "lang": tweet.lang
-            }
-        )
-    
-    return {"success": True, "tweets": formatted_tweets}
+    return {"success": True, "tweets": tweets}
@@ -1,8 +1,28 @@
 from celery import Celery
+from billiard.einfo import ExceptionWithTraceback
+from billiard.exceptions import WorkerLostError
+from celery.exceptions import Retry, SoftTimeLimitExceeded
+from celery.signals import worker_init
+from celery.worker.request import Request
 from app.core.config import settings
-from app.database import db
+from app.database import get_db
+from app.repositories.tasks import update_task_status
+from app.services.x import MAX_PAGE_SIZE, parse_time_period
+from contextlib import contextmanager
 from datetime import datetime
-from app.services.pipeline import execute_workflow
+from app.utils.events import publish_task_event
+from app.utils.rate_limit import RateLimitExceeded
+from app.utils.redis_utils import get_redis
+from app.utils import telemetry
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+# Small, latency-sensitive runs and large backfills are consumed by separate workers.
+SMALL_QUEUE = "workflows"
+LARGE_QUEUE = "workflows_large"
 
 celery = Celery(
     __name__,
@@ -10,39 +30,195 @@ celery = Celery(
     backend=settings.CELERY_RESULT_BACKEND,
     broker_connection_retry_on_startup=True
 )
+celery.conf.update(
+    task_default_queue=SMALL_QUEUE,
+    # Workflows run for minutes, mostly waiting on the APIs. Each worker process reserves
+    # only the task it is running, so nothing waits behind a long run in its prefetch
+    # buffer, and acknowledges it when done, so tasks of a worker that goes away are
+    # redelivered; the card ledger keeps a rerun from duplicating cards.
+    worker_prefetch_multiplier=1,
+    task_acks_late=True,
+)
+
+def workflow_queue(params: dict) -> str:
+    """
+    Pick the queue for a workflow by its expected size. Runs asking for at least
+    WORKFLOW_LARGE_MAX_TWEETS tweets, or for more than a page of them over a window longer
+    than WORKFLOW_BACKFILL_PERIOD, go to the large queue.
+    """
+    max_tweets = params.get("max_tweets") or 0
+    try:
+        window = parse_time_period(params.get("time_period") or "1d")
+        backfill = max_tweets > MAX_PAGE_SIZE and window > parse_time_period(settings.WORKFLOW_BACKFILL_PERIOD)
+    except ValueError:
+        # The workflow itself reports the invalid period.
+        backfill = False
+    return LARGE_QUEUE if max_tweets >= settings.WORKFLOW_LARGE_MAX_TWEETS or backfill else SMALL_QUEUE
+
+def workflow_options(params: dict) -> dict:
+    """apply_async options for a workflow: its queue and that queue's soft and hard time limits."""
+    queue = workflow_queue(params)
+    if queue == LARGE_QUEUE:
+        return {"queue": queue, "soft_time_limit": settings.WORKFLOW_LARGE_SOFT_TIME_LIMIT, "time_limit": settings.WORKFLOW_LARGE_TIME_LIMIT}
+    return {"queue": queue, "soft_time_limit": settings.WORKFLOW_SOFT_TIME_LIMIT, "time_limit": settings.WORKFLOW_TIME_LIMIT}
+
+@contextmanager
+def product_lock(product_name: str, timeout: float):
+    """
+    Hold the product's lock for the block, shared by all workers through Redis, so
+    overlapping runs for one product never execute at once. Yields False when another
+    run holds it. Without REDIS_URL there is nothing to share it with and it always yields True.
+
+    The lock expires after timeout seconds, in case its worker is killed while holding it.
+    """
+    redis_client = get_redis()
+    if redis_client is None:
+        yield True
+        return
+    lock = redis_client.lock(f"workflow:product:{product_name}", timeout=timeout)
+    try:
+        acquired = lock.acquire(blocking=False)
+    except Exception as e:
+        logger.warning(f"Product lock unavailable for '{product_name}', running without it: {e}")
+        lock, acquired = None, True
+    try:
+        yield acquired
+    finally:
+        if acquired and lock is not None:
+            try:
+                lock.release()
+            except Exception:
+                # Expired while the run went on; nothing left to release.
+                pass
+
+@worker_init.connect
+def preload_pipeline(**kwargs):
+    # Import the pipeline once in the worker's parent process so the forked children
+    # inherit the loaded modules; the SDK clients are still created per child on first use.
+    import app.services.pipeline  # noqa: F401
+
+def set_task_status(db, task_id: str, status: str, **fields):
+    """Store a status transition on the task document and publish it to status subscribers."""
+    update_task_status(db, task_id, status, **fields)
+    publish_task_event(task_id, "status", {"status": status, **fields})
+
+def _mark_lost(task_id: str, error: str):
+    try:
+        set_task_status(get_db(), task_id, "FAILED", error=error, completed_at=datetime.utcnow())
+    except Exception as e:
+        logger.error(f"Failed to mark lost task {task_id} as failed: {e}")
+
+class WorkflowRequest(Request):
+    """
+    Request of workflow tasks, handled in the worker's parent process.
+
+    A child killed at the hard time limit, or lost otherwise, e.g. to the OOM killer, never
+    records its end; this marks its task FAILED instead, so the task document and status
+    subscribers see it finish.
+    """
+
+    def on_timeout(self, soft, timeout):
+        if not soft:
+            _mark_lost(self.id, f"Killed after the hard time limit of {timeout} seconds.")
+        super().on_timeout(soft, timeout)
+
+    def on_failure(self, exc_info, send_failed_event=True, return_ok=False):
+        exc = exc_info.exception
+        if isinstance(exc, ExceptionWithTraceback):
+            exc = exc.exc
+        if isinstance(exc, WorkerLostError):
+            _mark_lost(self.id, f"The worker process running it was lost: {exc}")
+        super().on_failure(exc_info, send_failed_event=send_failed_event, return_ok=return_ok)
+
+@celery.task(bind=True, max_retries=None, Request=WorkflowRequest)
+def execute_workflow_task(self, workflow_params: dict, lock_retries: int = 0, incomplete_retries: int = 0):
+    """
+    Run a workflow, one at a time per product.
+
+    While another run of the same product holds its lock, the task is requeued every
+    WORKFLOW_LOCK_RETRY_DELAY seconds, up to WORKFLOW_LOCK_MAX_RETRIES times; lock_retries
+    counts those requeues, which do not use up the X_RATE_LIMIT_MAX_RETRIES of rate limits.
+    A run that left tweets unprocessed is retried for them after
+    WORKFLOW_INCOMPLETE_RETRY_DELAY seconds, or once CARD_LEDGER_LEASE has run out when
+    cards were left reserved by another attempt, up to WORKFLOW_INCOMPLETE_MAX_RETRIES times
+    counted by incomplete_retries, and then fails with its progress kept.
+    """
+    # Imported here so that the API, which imports this module only to enqueue tasks,
+    # does not load the pipeline and its SDKs.
+    from app.services.pipeline import IncompleteRun, execute_workflow
 
-@celery.task(bind=True)
-def execute_workflow_task(self, workflow_params: dict):
     task_id = self.request.id
+    db = get_db()
+    start = time.perf_counter()
+    status = "FAILED"
+    hard_limit, soft_limit = self.request.timelimit or (None, None)
+    lock_timeout = (hard_limit or soft_limit or settings.WORKFLOW_LARGE_TIME_LIMIT) + 60
     
     try:
-        # Update status to STARTED
-        db.tasks.update_one(
-            {"_id": task_id},
-            {"$set": {"status": "STARTED", "started_at": datetime.utcnow()}}
+        with product_lock(workflow_params["product_name"], lock_timeout) as acquired:
+            if not acquired:
+                if lock_retries >= settings.WORKFLOW_LOCK_MAX_RETRIES:
+                    error = f"Another run of '{workflow_params['product_name']}' kept the product busy."
+                    set_task_status(db, task_id, "FAILED", error=error, completed_at=datetime.utcnow())
+                    return None
+                set_task_status(db, task_id, "DELAYED", retry_after=settings.WORKFLOW_LOCK_RETRY_DELAY)
+                status = "DELAYED"
+                raise self.retry(
+                    args=[workflow_params],
+                    kwargs={"lock_retries": lock_retries + 1, "incomplete_retries": incomplete_retries},
+                    countdown=settings.WORKFLOW_LOCK_RETRY_DELAY,
+                )
+
+            # Update status to STARTED
+            set_task_status(db, task_id, "STARTED", started_at=datetime.utcnow())
+            
+            # Execute actual workflow, streaming metric updates to status subscribers
+            result = execute_workflow(
+                **workflow_params,
+                on_progress=lambda metrics: publish_task_event(task_id, "metrics", metrics),
+                # Saves per-tweet progress so a retry resumes where this attempt stopped
+                task_id=task_id
+            )
+            
+            # Store successful result
+            set_task_status(db, task_id, "COMPLETED", completed_at=datetime.utcnow(), result=result)
+            status = "COMPLETED"
+            return result
+
+    except RateLimitExceeded as e:
+        if self.request.retries - lock_retries - incomplete_retries >= settings.X_RATE_LIMIT_MAX_RETRIES:
+            set_task_status(db, task_id, "FAILED", error=str(e), completed_at=datetime.utcnow())
+            raise
+        # Requeue until the shared X budget resets instead of failing the run.
+        set_task_status(db, task_id, "DELAYED", retry_after=e.retry_after)
+        status = "DELAYED"
+        raise self.retry(exc=e, countdown=e.retry_after + 1)
+
+    except IncompleteRun as e:
+        if incomplete_retries >= settings.WORKFLOW_INCOMPLETE_MAX_RETRIES:
+            set_task_status(db, task_id, "FAILED", error=str(e), completed_at=datetime.utcnow(), result=e.result)
+            raise
+        set_task_status(db, task_id, "DELAYED", retry_after=e.retry_after)
+        status = "DELAYED"
+        raise self.retry(
+            args=[workflow_params],
+            kwargs={"lock_retries": lock_retries, "incomplete_retries": incomplete_retries + 1},
+            countdown=e.retry_after,
         )
+
+    except SoftTimeLimitExceeded:
+        set_task_status(db, task_id, "FAILED", error=f"Timed out after {soft_limit} seconds.", completed_at=datetime.utcnow())
+        raise
         
-        # Execute actual workflow
-        result = execute_workflow(**workflow_params)
-        
-        # Store successful result
-        db.tasks.update_one(
-            {"_id": task_id},
-            {"$set": {
-                "status": "COMPLETED",
-                "completed_at": datetime.utcnow(),
-                "result": result
-            }}
-        )
-        return result
+    except Retry:
+        # Requeued while the product was busy.
+        raise
         
     except Exception as e:
-        db.tasks.update_one(
-            {"_id": task_id},
-            {"$set": {
-                "status": "FAILED",
-                "error": str(e),
-                "completed_at": datetime.utcnow()
-            }}
-        )
-        raise
\ No newline at end of file
+        set_task_status(db, task_id, "FAILED", error=str(e), completed_at=datetime.utcnow())
+        raise
+
+    finally:
+        telemetry.WORKFLOW_TASK_SECONDS.observe(time.perf_counter() - start, status=status)
+        # Hand this run's samples to the API's /metrics before the worker moves on.
+        telemetry.flush()
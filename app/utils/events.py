@@ -0,0 +1,22 @@
+import json
+import logging
+from app.utils.redis_utils import get_redis
+
+logger = logging.getLogger(__name__)
+
+def task_channel(task_id: str) -> str:
+    return f"task-events:{task_id}"
+
+def publish_task_event(task_id: str, event: str, data: dict):
+    """
+    Publish a status or progress event for a task to its Redis channel.
+
+    A no-op without REDIS_URL; failures are logged and never interrupt the task.
+    """
+    redis_client = get_redis()
+    if redis_client is None or not task_id:
+        return
+    try:
+        redis_client.publish(task_channel(task_id), json.dumps({"event": event, "data": data}, default=str))
+    except Exception as e:
+        logger.warning(f"Failed to publish {event} event for task {task_id}: {e}")
@@ -1,21 +1,25 @@
 from datetime import datetime
-from bson import ObjectId
 
-def create_task_record(db, task_id: str):
-    task = {
-        "_id": task_id,
-        "status": "PENDING",
-        "created_at": datetime.utcnow(),
-        "updated_at": datetime.utcnow()
-    }
-    db.tasks.insert_one(task)
-    return task
+def get_fetch_checkpoint(db, product: str, query: str):
+    """Return the newest tweet seen for a product's search query, or None before the first run."""
+    return db.fetch_checkpoints.find_one({"_id": {"product": product, "query": query}})
 
-def update_task_status(db, task_id: str, status: str, result: dict = None):
-    update_data = {
-        "status": status,
-        "updated_at": datetime.utcnow()
+def update_fetch_checkpoint(db, product: str, query: str, newest_id: str, newest_created_at: datetime = None):
+    """Advance a product's checkpoint to newest_id. Checkpoints never move backwards."""
+    update = {
+        "$max": {"newest_id": int(newest_id)},
+        "$set": {"updated_at": datetime.utcnow()},
     }
-    if result:
-        update_data["result"] = result
-    db.tasks.update_one({"_id": task_id}, {"$set": update_data})
\ No newline at end of file
+    if newest_created_at:
+        update["$max"]["newest_created_at"] = newest_created_at
+    db.fetch_checkpoints.update_one({"_id": {"product": product, "query": query}}, update, upsert=True)
+
+def set_fetch_backlog(db, product: str, query: str, backlog: dict = None):
+    """
+    Record the part of a product's search a capped run left unfetched, or clear it.
+
+    The backlog holds "until_id", the oldest tweet fetched so far above the gap, and the
+    "newest_id" and "newest_created_at" the checkpoint moves to once the gap is fetched.
+    """
+    update = {"$set": {"backlog": backlog, "updated_at": datetime.utcnow()}} if backlog else {"$unset": {"backlog": ""}}
+    db.fetch_checkpoints.update_one({"_id": {"product": product, "query": query}}, update, upsert=True)
@@ -0,0 +1,154 @@
+import threading
+import time
+
+class TokenBucket:
+    """
+    In-process token bucket. Holds up to `capacity` tokens, refilled at `rate` tokens per second.
+    """
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self, tokens: float = 1):
+        """Block until `tokens` are available, then take them."""
+        while True:
+            with self._lock:
+                self._refill()
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return
+                wait = (tokens - self._tokens) / self.rate
+            time.sleep(wait)
+
+_buckets = {}
+_buckets_lock = threading.Lock()
+
+def get_bucket(name: str, rate: float, capacity: float) -> TokenBucket:
+    """Return the process-wide bucket registered under `name`, creating it on first use."""
+    with _buckets_lock:
+        bucket = _buckets.get(name)
+        if bucket is None:
+            bucket = _buckets[name] = TokenBucket(rate, capacity)
+        return bucket
+
+class RateLimitExceeded(Exception):
+    """Raised when a shared quota is exhausted for longer than the caller is willing to wait."""
+
+    def __init__(self, name: str, retry_after: float):
+        super().__init__(f"Rate limit for {name} exhausted; retry in {retry_after:.0f}s")
+        self.name = name
+        self.retry_after = retry_after
+
+# Takes one request from the budget. Returns 0 when the request may go ahead,
+# otherwise the number of seconds until the budget resets.
+_RESERVE_SCRIPT = """
+local limit = tonumber(redis.call('HGET', KEYS[1], 'limit'))
+local remaining = tonumber(redis.call('HGET', KEYS[1], 'remaining'))
+local reset = tonumber(redis.call('HGET', KEYS[1], 'reset'))
+local now = tonumber(ARGV[1])
+if remaining == nil or reset == nil then
+    return '0'
+end
+if reset <= now then
+    if limit == nil then
+        return '0'
+    end
+    redis.call('HSET', KEYS[1], 'remaining', limit - 1, 'reset', now + tonumber(ARGV[2]))
+    return '0'
+end
+if remaining > 0 then
+    redis.call('HINCRBY', KEYS[1], 'remaining', -1)
+    return '0'
+end
+return tostring(reset - now)
+"""
+
+class SharedQuota:
+    """
+    Request budget for one rate-limited API endpoint, learned from the API's rate-limit
+    headers and shared by every worker through Redis (in-process when Redis is not configured).
+
+    Callers reserve a request before sending it and record the headers of every response.
+    When the budget is spent, reserve() sleeps until it resets, or raises RateLimitExceeded
+    if that is further away than max_wait.
+    """
+
+    def __init__(self, name: str, window: float, redis_client=None):
+        self.name = name
+        self.key = f"ratelimit:{name}"
+        self.window = window
+        self.redis = redis_client
+        self._state = {}
+        self._lock = threading.Lock()
+        self._script = redis_client.register_script(_RESERVE_SCRIPT) if redis_client is not None else None
+
+    def _try_reserve(self) -> float:
+        now = time.time()
+        if self._script is not None:
+            return float(self._script(keys=[self.key], args=[int(now), int(self.window)]))
+        with self._lock:
+            state = self._state
+            if "remaining" not in state or "reset" not in state:
+                return 0.0
+            if state["reset"] <= now:
+                if "limit" in state:
+                    state["remaining"] = state["limit"] - 1
+                    state["reset"] = now + self.window
+                return 0.0
+            if state["remaining"] > 0:
+                state["remaining"] -= 1
+                return 0.0
+            return state["reset"] - now
+
+    def reserve(self, max_wait: float):
+        """Take one request from the budget, waiting up to max_wait seconds for it to reset."""
+        waited = 0.0
+        while True:
+            wait = self._try_reserve()
+            if wait <= 0:
+                return
+            if waited + wait > max_wait:
+                raise RateLimitExceeded(self.name, wait)
+            time.sleep(wait)
+            waited += wait
+
+    def record(self, limit=None, remaining=None, reset=None):
+        """Store the budget reported by the API. Missing values are left unchanged."""
+        values = {
+            field: int(value)
+            for field, value in (("limit", limit), ("remaining", remaining), ("reset", reset))
+            if value is not None
+        }
+        if not values:
+            return
+        if self.redis is not None:
+            pipe = self.redis.pipeline()
+            pipe.hset(self.key, mapping=values)
+            pipe.expire(self.key, int(self.window * 2))
+            pipe.execute()
+        else:
+            with self._lock:
+                self._state.update(values)
+
+    def usage(self) -> dict:
+        """Return the last known limit, remaining requests and reset time (epoch seconds)."""
+        if self.redis is not None:
+            state = {field: int(float(value)) for field, value in self.redis.hgetall(self.key).items()}
+        else:
+            with self._lock:
+                state = dict(self._state)
+        return {
+            "name": self.name,
+            "limit": state.get("limit"),
+            "remaining": state.get("remaining"),
+            "reset": state.get("reset"),
+        }
@@ -0,0 +1,46 @@
+import logging
+import threading
+import redis
+import redis.asyncio
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+_client = None
+_client_lock = threading.Lock()
+
+def get_redis():
+    """
+    Return the shared Redis client, or None when REDIS_URL is not configured.
+
+    Callers treat None as "no cross-process state" and fall back to in-process behaviour.
+    """
+    global _client
+    if not settings.REDIS_URL:
+        return None
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = redis.Redis.from_url(settings.REDIS_URL, decode_responses=True)
+    return _client
+
+_async_client = None
+
+def get_async_redis():
+    """
+    Return the API's asyncio Redis client, or None when REDIS_URL is not configured.
+
+    Only used from the FastAPI event loop; close_async_redis runs on shutdown.
+    """
+    global _async_client
+    if not settings.REDIS_URL:
+        return None
+    if _async_client is None:
+        _async_client = redis.asyncio.Redis.from_url(settings.REDIS_URL, decode_responses=True)
+    return _async_client
+
+async def close_async_redis():
+    global _async_client
+    if _async_client is not None:
+        await _async_client.aclose()
+        _async_client = None
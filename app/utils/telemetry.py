@@ -0,0 +1,180 @@
+# Minimal Prometheus-style metrics: counters and histograms rendered in the text exposition format.
+#
+# Each process records into its own registry. With REDIS_URL set, flush() adds the samples
+# recorded since the last flush to Redis hashes, so GET /metrics on the API can report the
+# totals of every worker. Without Redis, /metrics reports the API process only.
+import json
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from app.utils.redis_utils import get_redis
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0)
+_REDIS_PREFIX = "telemetry:"
+
+_registry = []
+_lock = threading.Lock()
+
+def _format_value(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _format_labels(labels: dict) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(str(value))}"' for key, value in labels.items()) + "}"
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        # Samples are keyed by (suffix, labels) where labels is a tuple of (name, value) pairs.
+        self._samples = {}
+        self._pending = {}
+        with _lock:
+            _registry.append(self)
+
+    def _labels(self, labels: dict) -> tuple:
+        return tuple((name, str(labels.get(name, ""))) for name in self.labelnames)
+
+    def _add(self, suffix: str, labels: tuple, amount: float):
+        key = (suffix, labels)
+        with _lock:
+            self._samples[key] = self._samples.get(key, 0.0) + amount
+            self._pending[key] = self._pending.get(key, 0.0) + amount
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        self._add("_total", self._labels(labels), amount)
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = (), buckets: tuple = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets) + (float("inf"),)
+
+    def observe(self, value: float, **labels):
+        base = self._labels(labels)
+        # Buckets are stored cumulatively, so samples from several processes simply add up.
+        for bound in self.buckets:
+            if value <= bound:
+                le = "+Inf" if bound == float("inf") else _format_value(bound)
+                self._add("_bucket", base + (("le", le),), 1)
+        self._add("_count", base, 1)
+        self._add("_sum", base, value)
+
+    @contextmanager
+    def time(self, **labels):
+        """Observe the duration of the block."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+def flush():
+    """Add this process's samples since the last flush to the shared Redis totals."""
+    redis_client = get_redis()
+    if redis_client is None:
+        return
+    with _lock:
+        pending = [(metric, metric._pending) for metric in _registry if metric._pending]
+        for metric, _ in pending:
+            metric._pending = {}
+    if not pending:
+        return
+    try:
+        pipe = redis_client.pipeline(transaction=False)
+        for metric, samples in pending:
+            for (suffix, labels), amount in samples.items():
+                pipe.hincrbyfloat(_REDIS_PREFIX + metric.name, json.dumps([suffix, labels]), amount)
+        pipe.execute()
+    except Exception as e:
+        logger.warning(f"Failed to flush telemetry to Redis: {e}")
+        # Put the samples back so they are sent with the next flush.
+        with _lock:
+            for metric, samples in pending:
+                for key, amount in samples.items():
+                    metric._pending[key] = metric._pending.get(key, 0.0) + amount
+
+def _collect(metric: _Metric, redis_client) -> dict:
+    if redis_client is None:
+        with _lock:
+            return dict(metric._samples)
+    samples = {}
+    for field, value in redis_client.hgetall(_REDIS_PREFIX + metric.name).items():
+        suffix, labels = json.loads(field)
+        samples[(suffix, tuple(tuple(pair) for pair in labels))] = float(value)
+    return samples
+
+def _sort_key(item):
+    (suffix, labels), _ = item
+    # Group a series' buckets, sum and count together, buckets ordered by their numeric bound.
+    series = [pair for pair in labels if pair[0] != "le"]
+    bound = [float(value) for name, value in labels if name == "le"]
+    return series, suffix != "_bucket", suffix, bound
+
+def render() -> str:
+    """Render every registered metric in the Prometheus text format."""
+    redis_client = get_redis()
+    if redis_client is not None:
+        flush()
+    with _lock:
+        metrics = list(_registry)
+    lines = []
+    for metric in metrics:
+        lines.append(f"# HELP {metric.name} {metric.documentation}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        for (suffix, labels), value in sorted(_collect(metric, redis_client).items(), key=_sort_key):
+            lines.append(f"{metric.name}{suffix}{_format_labels(dict(labels))} {_format_value(value)}")
+    return "\n".join(lines) + "\n"
+
+# Metrics shared by the services, pipeline and tasks.
+EXTERNAL_CALL_SECONDS = Histogram(
+    "external_call_seconds",
+    "Latency of calls to external APIs.",
+    ("service", "operation"),
+)
+EXTERNAL_CALL_ERRORS = Counter(
+    "external_call_errors",
+    "Failed calls to external APIs.",
+    ("service", "operation"),
+)
+PIPELINE_STAGE_SECONDS = Histogram(
+    "pipeline_stage_seconds",
+    "Time spent in each pipeline stage per run, summed over the stage's workers.",
+    ("stage",),
+)
+PIPELINE_ITEMS = Counter(
+    "pipeline_items",
+    "Items counted by the pipeline, by Metrics field.",
+    ("metric",),
+)
+WORKFLOW_TASK_SECONDS = Histogram(
+    "workflow_task_seconds",
+    "Duration of workflow Celery tasks.",
+    ("status",),
+)
+
+@contextmanager
+def external_call(service: str, operation: str):
+    """Time a call to an external API and count it as an error if it raises."""
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        EXTERNAL_CALL_ERRORS.inc(service=service, operation=operation)
+        raise
+    finally:
+        EXTERNAL_CALL_SECONDS.observe(time.perf_counter() - start, service=service, operation=operation)
@@ -0,0 +1,366 @@
+# In-process stand-ins for the X search, Gemini generate_content and Trello REST APIs.
+#
+# Each fake runs a ThreadingHTTPServer on 127.0.0.1 in a daemon thread and answers with
+# deterministic data, so benchmark runs need no network and no API keys. Latency, server
+# errors and 429 rate limits can be injected per service through its Faults.
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+WORDS = (
+    "app crashes login sync dark mode export csv slow search notifications battery widget "
+    "offline upload timeout billing invoice android ios keyboard shortcut calendar reminder "
+    "settings profile password reset onboarding tutorial latency dashboard chart filter"
+).split()
+
+class Faults:
+    """
+    Injected behaviour of a fake service.
+
+    Parameters:
+        latency (float): Mean seconds added to every response.
+        jitter (float): Random +/- seconds around the mean latency.
+        error_rate (float): Share of requests answered with a 500.
+        rate_limit_rate (float): Share of requests answered with a 429.
+        retry_after (float): Seconds advertised by 429 responses.
+    """
+
+    def __init__(self, latency: float = 0.0, jitter: float = 0.0, error_rate: float = 0.0, rate_limit_rate: float = 0.0, retry_after: float = 1.0):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.retry_after = retry_after
+
+    def as_dict(self) -> dict:
+        return dict(vars(self))
+
+class FakeService:
+    """Base class running a fake API on a local port and counting the calls it answers."""
+
+    name = None
+
+    def __init__(self, faults: Faults = None, seed: int = 0):
+        self.faults = faults or Faults()
+        self.random = random.Random(seed)
+        self._random_lock = threading.Lock()
+        self.calls = Counter()
+        self._calls_lock = threading.Lock()
+        self._server = None
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        service = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                service._dispatch(self, "GET")
+
+            def do_POST(self):
+                service._dispatch(self, "POST")
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, name=f"fake-{self.name}", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def reset(self):
+        """Forget the calls counted so far."""
+        with self._calls_lock:
+            self.calls.clear()
+
+    def call_counts(self) -> dict:
+        with self._calls_lock:
+            return dict(self.calls)
+
+    def _roll(self) -> float:
+        with self._random_lock:
+            return self.random.random()
+
+    def _dispatch(self, handler: BaseHTTPRequestHandler, method: str):
+        url = urlparse(handler.path)
+        length = int(handler.headers.get("Content-Length") or 0)
+        body = handler.rfile.read(length) if length else b""
+        operation = f"{method} {self.route_name(url.path)}"
+
+        faults = self.faults
+        delay = faults.latency + (self._roll() * 2 - 1) * faults.jitter
+        if delay > 0:
+            time.sleep(delay)
+
+        roll = self._roll()
+        if roll < faults.rate_limit_rate:
+            status, payload, headers = 429, self.error_payload(429, "rate limited"), self.rate_limit_headers()
+        elif roll < faults.rate_limit_rate + faults.error_rate:
+            status, payload, headers = 500, self.error_payload(500, "injected failure"), {}
+        else:
+            try:
+                status, payload, headers = self.handle(method, url.path, parse_qs(url.query), body)
+            except Exception as e:
+                status, payload, headers = 500, self.error_payload(500, str(e)), {}
+
+        with self._calls_lock:
+            self.calls[operation] += 1
+            self.calls[f"status {status}"] += 1
+
+        data = json.dumps(payload).encode()
+        handler.send_response(status)
+        handler.send_header("Content-Type", "application/json")
+        handler.send_header("Content-Length", str(len(data)))
+        for name, value in headers.items():
+            handler.send_header(name, str(value))
+        handler.end_headers()
+        handler.wfile.write(data)
+
+    def route_name(self, path: str) -> str:
+        return path
+
+    def rate_limit_headers(self) -> dict:
+        return {"Retry-After": self.faults.retry_after}
+
+    def error_payload(self, status: int, message: str):
+        return {"error": message}
+
+    def handle(self, method: str, path: str, query: dict, body: bytes):
+        raise NotImplementedError
+
+class FakeX(FakeService):
+    """
+    GET /2/tweets/search/recent over a generated corpus of tweet_count tweets.
+
+    Results page with next_token like the real API and honour since_id, and every
+    response advertises a rate limit budget large enough not to throttle a benchmark.
+    """
+
+    name = "x"
+    RATE_LIMIT = 100_000
+
+    def __init__(self, faults: Faults = None, seed: int = 0, tweet_count: int = 100):
+        super().__init__(faults, seed)
+        self.set_corpus(tweet_count)
+
+    def set_corpus(self, tweet_count: int, seed: int = 0, noise: float = 0.0, products: tuple = ("benchmark",)):
+        """
+        Replace the searchable tweets with tweet_count generated ones per product, newest
+        first, each mentioning its product. About a noise share of them are in Spanish or
+        hold only a link.
+        """
+        corpus_random = random.Random(seed)
+        now = datetime.now(timezone.utc)
+        base_id = 1_900_000_000_000_000_000
+
+        def text_and_lang(index, product):
+            if corpus_random.random() < noise:
+                if corpus_random.random() < 0.5:
+                    return f"#{index} {product} la aplicación no funciona hoy", "es"
+                return f"{product} https://t.co/{index:08x}", "en"
+            return f"#{index} {product} " + " ".join(corpus_random.choices(WORDS, k=corpus_random.randint(8, 20))), "en"
+
+        self.tweets = []
+        for index in range(tweet_count * len(products)):
+            text, lang = text_and_lang(index, products[index % len(products)])
+            self.tweets.append({
+                "id": str(base_id + tweet_count * len(products) - index),
+                "text": text,
+                "created_at": (now - timedelta(seconds=index)).strftime("%Y-%m-%dT%H:%M:%S.000Z"),
+                "lang": lang,
+                "public_metrics": {
+                    "retweet_count": corpus_random.randint(0, 50),
+                    "reply_count": corpus_random.randint(0, 20),
+                    "like_count": corpus_random.randint(0, 500),
+                    "quote_count": 0,
+                },
+            })
+
+    @staticmethod
+    def matches(search: str, text: str) -> bool:
+        """Plain keyword queries and ORs of them; other operators are ignored."""
+        words = set(re.findall(r"\w+", text.lower()))
+        alternatives = [part.strip(" ()") for part in search.split(" OR ")]
+        return any(
+            all(word in words for word in re.findall(r"\w+", alternative.lower()))
+            for alternative in alternatives
+        )
+
+    def rate_limit_headers(self) -> dict:
+        return {
+            "x-rate-limit-limit": self.RATE_LIMIT,
+            "x-rate-limit-remaining": 0,
+            "x-rate-limit-reset": int(time.time() + self.faults.retry_after),
+        }
+
+    def handle(self, method, path, query, body):
+        if method != "GET" or path != "/2/tweets/search/recent":
+            return 404, {"error": "not found"}, {}
+        max_results = int(query.get("max_results", ["10"])[0])
+        offset = int(query.get("pagination_token", query.get("next_token", ["0"]))[0])
+        tweets = [tweet for tweet in self.tweets if self.matches(query.get("query", [""])[0], tweet["text"])]
+        since_id = query.get("since_id", [None])[0]
+        if since_id:
+            tweets = [tweet for tweet in tweets if int(tweet["id"]) > int(since_id)]
+        page = tweets[offset:offset + max_results]
+        meta = {"result_count": len(page)}
+        if offset + max_results < len(tweets):
+            meta["next_token"] = str(offset + max_results)
+        payload = {"meta": meta}
+        if page:
+            payload["data"] = page
+            meta["newest_id"] = page[0]["id"]
+            meta["oldest_id"] = page[-1]["id"]
+        headers = {
+            "x-rate-limit-limit": self.RATE_LIMIT,
+            "x-rate-limit-remaining": self.RATE_LIMIT - 1,
+            "x-rate-limit-reset": int(time.time() + 900),
+        }
+        return 200, payload, headers
+
+def _decision(post_id: str, add_ratio: float) -> dict:
+    """Deterministic classification of a post, adding about add_ratio of them."""
+    digest = int(hashlib.sha256(str(post_id).encode()).hexdigest()[:8], 16)
+    if digest % 1000 >= add_ratio * 1000:
+        return {"add": False, "reason": "Not a product request."}
+    priority = ("High", "Medium", "Low")[digest % 3]
+    return {
+        "add": True,
+        "card_name": f"[Bug Report] Benchmark issue {post_id}",
+        "priority": priority,
+        "card_description": f"Generated by the benchmark Gemini stand-in for post {post_id}.",
+    }
+
+class FakeGemini(FakeService):
+    """
+    POST /v1beta/models/<model>:generateContent as called by the REST transport.
+
+    A message holding a JSON array of posts is answered with one decision per post.
+    Posts embedded in a free-form prompt are found by their ids.
+    """
+
+    name = "gemini"
+    _POST_ID = re.compile(r'"id":\s*"([^"]+)"')
+
+    def __init__(self, faults: Faults = None, seed: int = 0, add_ratio: float = 0.3):
+        super().__init__(faults, seed)
+        self.add_ratio = add_ratio
+
+    def route_name(self, path: str) -> str:
+        return re.sub(r"/models/[^/:]+", "/models/{model}", path)
+
+    def handle(self, method, path, query, body):
+        if method != "POST" or not path.endswith(":generateContent"):
+            return 404, self.error_payload(404, "not found"), {}
+        request = json.loads(body or b"{}")
+        prompt = "\n".join(
+            part.get("text", "")
+            for content in request.get("contents", [])
+            for part in content.get("parts", [])
+        )
+        try:
+            posts = json.loads(prompt)
+        except ValueError:
+            posts = None
+        if isinstance(posts, list):
+            # Posts sent as a JSON array, with the instructions in the system instruction.
+            answer = [{"id": str(post.get("id")), **_decision(post.get("id"), self.add_ratio)} for post in posts]
+        else:
+            # Posts embedded in a free-form prompt.
+            post_ids = self._POST_ID.findall(prompt)
+            if len(post_ids) > 1 or "JSON array" in prompt:
+                answer = [{"id": post_id, **_decision(post_id, self.add_ratio)} for post_id in post_ids]
+            else:
+                answer = _decision(post_ids[0] if post_ids else hashlib.sha256(prompt.encode()).hexdigest(), self.add_ratio)
+        text = json.dumps(answer)
+        payload = {
+            "candidates": [{
+                "content": {"parts": [{"text": text}], "role": "model"},
+                "finishReason": "STOP",
+                "index": 0,
+            }],
+            "usageMetadata": {
+                "promptTokenCount": len(prompt) // 4,
+                "candidatesTokenCount": len(text) // 4,
+                "totalTokenCount": (len(prompt) + len(text)) // 4,
+            },
+        }
+        return 200, payload, {}
+
+    def rate_limit_headers(self) -> dict:
+        return {}
+
+    def error_payload(self, status: int, message: str):
+        # google-api-core reads the error details from this shape.
+        names = {404: "NOT_FOUND", 429: "RESOURCE_EXHAUSTED", 500: "INTERNAL"}
+        return {"error": {"code": status, "message": message, "status": names.get(status, "UNKNOWN")}}
+
+class FakeTrello(FakeService):
+    """The boards, lists and cards endpoints used by app.services.trello, kept in memory."""
+
+    name = "trello"
+    _ID = re.compile(r"/[0-9a-f]{24}(?=/|$)")
+
+    def __init__(self, faults: Faults = None, seed: int = 0):
+        super().__init__(faults, seed)
+        self._state_lock = threading.Lock()
+        self.boards = {}
+        self.lists = {}
+        self.cards = {}
+
+    def _new_id(self) -> str:
+        with self._random_lock:
+            return "%024x" % self.random.getrandbits(96)
+
+    def route_name(self, path: str) -> str:
+        return self._ID.sub("/{id}", path)
+
+    def handle(self, method, path, query, body):
+        params = {name: values[0] for name, values in query.items()}
+        parts = path.strip("/").split("/")
+        if parts[:1] == ["1"]:
+            parts = parts[1:]
+        with self._state_lock:
+            if method == "GET" and parts == ["members", "me", "boards"]:
+                return 200, [{"id": board_id, "name": name} for board_id, name in self.boards.items()], {}
+            if method == "POST" and parts == ["boards"]:
+                board_id = self._new_id()
+                self.boards[board_id] = params.get("name", "")
+                return 200, {"id": board_id, "name": self.boards[board_id]}, {}
+            if method == "GET" and len(parts) == 3 and parts[0] == "boards" and parts[2] == "lists":
+                if parts[1] not in self.boards:
+                    return 404, {"message": "board not found"}, {}
+                return 200, [{"id": list_id, "name": name} for list_id, (board_id, name) in self.lists.items() if board_id == parts[1]], {}
+            if method == "POST" and parts == ["lists"]:
+                if params.get("idBoard") not in self.boards:
+                    return 404, {"message": "board not found"}, {}
+                list_id = self._new_id()
+                self.lists[list_id] = (params["idBoard"], params.get("name", ""))
+                return 200, {"id": list_id, "name": params.get("name", ""), "idBoard": params["idBoard"]}, {}
+            if method == "POST" and parts == ["cards"]:
+                if params.get("idList") not in self.lists:
+                    return 404, {"message": "list not found"}, {}
+                card_id = self._new_id()
+                self.cards[card_id] = params
+                return 200, {"id": card_id, "name": params.get("name", ""), "idList": params["idList"]}, {}
+        return 404, {"message": "not found"}, {}
@@ -0,0 +1,281 @@
+# Offline benchmark of app.services.pipeline.execute_workflow.
+#
+# Starts the fake X, Gemini and Trello services from benchmarks.fake_services, points the
+# app at them through X_API_URL, GEMINI_API_ENDPOINT and TRELLO_API_URL, and sweeps tweet
+# counts and concurrency levels. Every scenario reports throughput, p50/p99 latency of the
+# runs and of the external calls, and the calls each fake answered. Results are written as
+# JSON and can be compared against an earlier file with --compare.
+#
+#   python -m benchmarks.run --tweets 50,200 --concurrency 1,4 --gemini-latency 0.3
+#   python -m benchmarks.run --compare benchmarks/results/baseline.json
+#
+# The Mongo-backed features (fetch checkpoints, deduplication, classification cache and
+# the prefilter's classifier) are
+# off unless --mongo is given, in which case they use the MONGODB_URI server and a
+# separate "benchmark" database. REDIS_URL is ignored unless --redis is given.
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from pathlib import Path
+
+from benchmarks.fake_services import Faults, FakeGemini, FakeTrello, FakeX
+
+RESULTS_DIR = Path(__file__).parent / "results"
+
+def percentile(values: list, share: float):
+    """Nearest-rank percentile of values, or None when there are none."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, round(share * len(ordered) + 0.5) - 1))
+    return ordered[rank]
+
+def int_list(value: str) -> list:
+    return [int(item) for item in value.split(",") if item.strip()]
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the workflow pipeline against local stand-ins for X, Gemini and Trello.")
+    parser.add_argument("--tweets", type=int_list, default=[50, 200], help="comma-separated tweet counts to sweep")
+    parser.add_argument("--concurrency", type=int_list, default=[1, 4], help="comma-separated GEMINI_CONCURRENCY and TRELLO_CONCURRENCY levels to sweep")
+    parser.add_argument("--batch-size", type=int, default=None, help="GEMINI_BATCH_SIZE for every scenario")
+    parser.add_argument("--workflows", type=int, default=1, help="workflows for different products run at once per run; with --redis their fetches are coalesced")
+    parser.add_argument("--repeat", type=int, default=3, help="measured runs per scenario")
+    parser.add_argument("--warmup", type=int, default=1, help="unmeasured runs before the sweep")
+    parser.add_argument("--add-ratio", type=float, default=0.3, help="share of tweets the fake Gemini turns into cards")
+    parser.add_argument("--noise", type=float, default=0.0, help="share of fetched tweets that are foreign-language or link-only")
+    parser.add_argument("--seed", type=int, default=0)
+    for service in ("x", "gemini", "trello"):
+        parser.add_argument(f"--{service}-latency", type=float, default=0.0, help=f"mean seconds added to {service} responses")
+        parser.add_argument(f"--{service}-jitter", type=float, default=0.0, help=f"random +/- seconds around the {service} latency")
+        parser.add_argument(f"--{service}-error-rate", type=float, default=0.0, help=f"share of {service} requests failing with 500")
+        parser.add_argument(f"--{service}-rate-limit-rate", type=float, default=0.0, help=f"share of {service} requests failing with 429")
+        parser.add_argument(f"--{service}-retry-after", type=float, default=1.0, help=f"seconds advertised by {service} 429 responses")
+    parser.add_argument("--mongo", action="store_true", help="keep checkpoints, dedup and the classification cache on, using the 'benchmark' database")
+    parser.add_argument("--redis", action="store_true", help="keep REDIS_URL from the environment")
+    parser.add_argument("--output", type=Path, default=None, help="results file (default: benchmarks/results/<timestamp>.json)")
+    parser.add_argument("--compare", type=Path, default=None, help="earlier results file to compare throughput against")
+    parser.add_argument("--tolerance", type=float, default=0.1, help="throughput drop reported as a regression by --compare")
+    return parser.parse_args(argv)
+
+def faults_for(args, service: str) -> Faults:
+    return Faults(
+        latency=getattr(args, f"{service}_latency"),
+        jitter=getattr(args, f"{service}_jitter"),
+        error_rate=getattr(args, f"{service}_error_rate"),
+        rate_limit_rate=getattr(args, f"{service}_rate_limit_rate"),
+        retry_after=getattr(args, f"{service}_retry_after"),
+    )
+
+def configure_environment(args, x: FakeX, gemini: FakeGemini, trello: FakeTrello):
+    """Point the app at the fakes. Must run before anything under app is imported."""
+    os.environ["X_API_URL"] = x.url
+    os.environ["GEMINI_API_ENDPOINT"] = gemini.url
+    os.environ["TRELLO_API_URL"] = f"{trello.url}/1"
+    os.environ["X_BEARER_TOKEN"] = "benchmark-bearer-token"
+    os.environ["GEMINI_API_KEY"] = "benchmark-gemini-key"
+    if args.mongo:
+        os.environ["MONGODB_DB_NAME"] = "benchmark"
+    else:
+        for flag in ("FETCH_CHECKPOINTS_ENABLED", "DEDUP_ENABLED", "CLASSIFICATION_CACHE_ENABLED", "PREFILTER_CLASSIFIER_ENABLED", "CARD_LEDGER_ENABLED"):
+            os.environ[flag] = "false"
+    if not args.redis:
+        # An empty value overrides any REDIS_URL in .env.
+        os.environ["REDIS_URL"] = ""
+
+class CallRecorder:
+    """Collects raw external call durations by wrapping the telemetry histogram."""
+
+    def __init__(self, histogram):
+        self.samples = {}
+        self._lock = threading.Lock()
+        observe = histogram.observe
+
+        def record(value, **labels):
+            with self._lock:
+                self.samples.setdefault(labels.get("service", "unknown"), []).append(value)
+            observe(value, **labels)
+
+        histogram.observe = record
+
+    def take(self) -> dict:
+        with self._lock:
+            samples, self.samples = self.samples, {}
+        return samples
+
+def run_scenario(args, pipeline, settings, recorder, fakes: dict, tweets: int, concurrency: int) -> dict:
+    settings.GEMINI_CONCURRENCY = concurrency
+    settings.TRELLO_CONCURRENCY = concurrency
+    if args.batch_size:
+        settings.GEMINI_BATCH_SIZE = args.batch_size
+    products = tuple(f"product{index}" for index in range(args.workflows)) if args.workflows > 1 else ("benchmark",)
+    fakes["x"].set_corpus(tweets, seed=args.seed, noise=args.noise, products=products)
+    for fake in fakes.values():
+        fake.reset()
+    recorder.take()
+
+    def workflow(product):
+        return pipeline.execute_workflow(
+            product_name=product,
+            product_description="A product used to benchmark the workflow pipeline.",
+            trello_api_key="benchmark-trello-key",
+            trello_token="benchmark-trello-token",
+            prioritization_rule="High engagement bug reports first.",
+            time_period="7d",
+            max_tweets=tweets,
+            board_name="Benchmark Board",
+            list_name=f"Benchmark {product}",
+        )
+
+    durations = []
+    runs = []
+    for _ in range(args.repeat):
+        start = time.perf_counter()
+        # Concurrent workflows stand in for separate workers picking up scheduled runs together.
+        with ThreadPoolExecutor(max_workers=len(products)) as pool:
+            results = list(pool.map(workflow, products))
+        durations.append(time.perf_counter() - start)
+        runs.extend(
+            {
+                "success": result["success"],
+                "error": result.get("error"),
+                "metrics": result["metrics"],
+                "timings": result.get("timings", {}),
+            }
+            for result in results
+        )
+
+    calls = recorder.take()
+    processed = sum(run["metrics"]["processed_tweets"] for run in runs)
+    cards = sum(run["metrics"]["cards_added"] for run in runs)
+    total = sum(durations)
+    stage_names = sorted({stage for run in runs for stage in run["timings"]})
+    return {
+        "tweets": tweets,
+        "concurrency": concurrency,
+        "batch_size": settings.GEMINI_BATCH_SIZE,
+        "workflows": len(products),
+        "runs": len(durations),
+        "failed_workflows": sum(not run["success"] for run in runs),
+        "errors": sorted({run["error"] for run in runs if run["error"]}),
+        "tweets_per_second": processed / total if total else 0.0,
+        "cards_per_second": cards / total if total else 0.0,
+        "run_seconds": {
+            "p50": percentile(durations, 0.5),
+            "p99": percentile(durations, 0.99),
+            "mean": statistics.fmean(durations),
+        },
+        "stage_seconds": {
+            stage: statistics.fmean(run["timings"].get(stage, 0.0) for run in runs)
+            for stage in stage_names
+        },
+        "call_seconds": {
+            service: {"count": len(values), "p50": percentile(values, 0.5), "p99": percentile(values, 0.99)}
+            for service, values in sorted(calls.items())
+        },
+        "calls": {name: fake.call_counts() for name, fake in fakes.items()},
+        "metrics": {
+            key: sum(run["metrics"][key] for run in runs)
+            for key in runs[0]["metrics"] if key != "time_taken"
+        },
+    }
+
+def scenario_key(scenario: dict) -> tuple:
+    return scenario["tweets"], scenario["concurrency"], scenario["batch_size"], scenario.get("workflows", 1)
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list:
+    """Return a line per scenario present in both files, marking throughput regressions."""
+    previous = {scenario_key(scenario): scenario for scenario in baseline.get("scenarios", [])}
+    lines = []
+    for scenario in results["scenarios"]:
+        before = previous.get(scenario_key(scenario))
+        if not before or not before["tweets_per_second"]:
+            continue
+        change = scenario["tweets_per_second"] / before["tweets_per_second"] - 1
+        flag = "REGRESSION" if change < -tolerance else "ok"
+        lines.append(
+            f"tweets={scenario['tweets']:<6} concurrency={scenario['concurrency']:<3} "
+            f"{before['tweets_per_second']:9.1f} -> {scenario['tweets_per_second']:9.1f} tweets/s "
+            f"({change:+.1%}) {flag}"
+        )
+    return lines
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except Exception:
+        return None
+
+def print_scenario(scenario: dict):
+    run_seconds = scenario["run_seconds"]
+    calls = ", ".join(
+        f"{service} {stats['count']} calls p50 {stats['p50'] * 1000:.0f}ms p99 {stats['p99'] * 1000:.0f}ms"
+        for service, stats in scenario["call_seconds"].items()
+    )
+    print(
+        f"tweets={scenario['tweets']:<6} concurrency={scenario['concurrency']:<3} "
+        f"{scenario['tweets_per_second']:9.1f} tweets/s  run p50 {run_seconds['p50']:.3f}s p99 {run_seconds['p99']:.3f}s  "
+        f"failed {scenario['failed_workflows']}/{scenario['runs'] * scenario['workflows']}  [{calls}]"
+    )
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    fakes = {
+        "x": FakeX(faults_for(args, "x"), seed=args.seed),
+        "gemini": FakeGemini(faults_for(args, "gemini"), seed=args.seed, add_ratio=args.add_ratio),
+        "trello": FakeTrello(faults_for(args, "trello"), seed=args.seed),
+    }
+    for fake in fakes.values():
+        fake.start()
+    configure_environment(args, fakes["x"], fakes["gemini"], fakes["trello"])
+
+    from app.core.config import settings
+    from app.services import pipeline
+    from app.utils import telemetry
+    recorder = CallRecorder(telemetry.EXTERNAL_CALL_SECONDS)
+
+    try:
+        for _ in range(args.warmup):
+            run_scenario(args, pipeline, settings, recorder, fakes, min(args.tweets), min(args.concurrency))
+        scenarios = []
+        for tweets in args.tweets:
+            for concurrency in args.concurrency:
+                scenario = run_scenario(args, pipeline, settings, recorder, fakes, tweets, concurrency)
+                print_scenario(scenario)
+                scenarios.append(scenario)
+    finally:
+        for fake in fakes.values():
+            fake.stop()
+
+    results = {
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "revision": git_revision(),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "faults": {name: fake.faults.as_dict() for name, fake in fakes.items()},
+        "mongo": args.mongo,
+        "redis": args.redis,
+        "scenarios": scenarios,
+    }
+    output = args.output or RESULTS_DIR / f"{datetime.now().strftime('%Y%m%d-%H%M%S')}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(results, indent=2))
+    print(f"Results written to {output}")
+
+    if args.compare:
+        lines = compare(results, json.loads(args.compare.read_text()), args.tolerance)
+        print(f"Compared with {args.compare}:")
+        print("\n".join(lines) if lines else "No matching scenarios.")
+        if any(line.endswith("REGRESSION") for line in lines):
+            return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
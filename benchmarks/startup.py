@@ -0,0 +1,97 @@
+# Cold import cost of the API and worker entry points.
+#
+# Each target module is imported in a fresh interpreter with -X importtime, so the numbers
+# include everything a new API replica or Celery worker loads before serving. Reports the
+# median wall time per target and the slowest imports by cumulative time, and saves them
+# as JSON like benchmarks.run.
+#
+#   python -m benchmarks.startup
+#   python -m benchmarks.startup --repeat 10 --compare benchmarks/results/startup-baseline.json
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+from benchmarks.run import RESULTS_DIR, git_revision
+
+TARGETS = ("app.main", "app.tasks.workflow_tasks", "app.services.pipeline")
+
+def import_once(module: str, env: dict) -> tuple:
+    """Import module in a new interpreter; return wall seconds and {module: cumulative seconds}."""
+    start = time.perf_counter()
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True, text=True, env=env,
+    )
+    elapsed = time.perf_counter() - start
+    if completed.returncode != 0:
+        raise RuntimeError(f"Importing {module} failed:\n{completed.stderr[-2000:]}")
+    cumulative = {}
+    for line in completed.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative_us, name = line[len("import time:"):].split("|")
+        if cumulative_us.strip().isdigit():
+            cumulative[name.strip()] = int(cumulative_us) / 1_000_000
+    return elapsed, cumulative
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Measure the cold import time of the API and worker modules.")
+    parser.add_argument("--targets", default=",".join(TARGETS), help="comma-separated modules to import")
+    parser.add_argument("--repeat", type=int, default=5, help="fresh interpreters per target")
+    parser.add_argument("--top", type=int, default=10, help="slowest imports listed per target")
+    parser.add_argument("--output", type=Path, default=None, help="results file (default: benchmarks/results/startup-<timestamp>.json)")
+    parser.add_argument("--compare", type=Path, default=None, help="earlier startup results to compare against")
+    args = parser.parse_args(argv)
+
+    # Startup must not depend on secrets; run without them to prove it.
+    env = {key: value for key, value in os.environ.items() if key not in ("X_BEARER_TOKEN", "GEMINI_API_KEY")}
+    results = {
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "revision": git_revision(),
+        "python": sys.version.split()[0],
+        "targets": {},
+    }
+    for module in filter(None, (target.strip() for target in args.targets.split(","))):
+        walls = []
+        imports = {}
+        for _ in range(args.repeat):
+            wall, cumulative = import_once(module, env)
+            walls.append(wall)
+            for name, seconds in cumulative.items():
+                imports.setdefault(name, []).append(seconds)
+        # Only top-level packages and app modules, so nested imports are not counted twice.
+        slowest = sorted(
+            ((name, statistics.median(values)) for name, values in imports.items() if "." not in name or name.startswith("app.")),
+            key=lambda item: item[1], reverse=True,
+        )[:args.top]
+        results["targets"][module] = {
+            "wall_seconds": {"median": statistics.median(walls), "min": min(walls), "max": max(walls)},
+            "slowest_imports": dict(slowest),
+        }
+        print(f"{module:<28} {statistics.median(walls):.3f}s median over {len(walls)} runs")
+        for name, seconds in slowest:
+            print(f"    {seconds:7.3f}s  {name}")
+
+    output = args.output or RESULTS_DIR / f"startup-{datetime.now().strftime('%Y%m%d-%H%M%S')}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(results, indent=2))
+    print(f"Results written to {output}")
+
+    if args.compare:
+        baseline = json.loads(args.compare.read_text()).get("targets", {})
+        print(f"Compared with {args.compare}:")
+        for module, target in results["targets"].items():
+            if module in baseline:
+                before = baseline[module]["wall_seconds"]["median"]
+                after = target["wall_seconds"]["median"]
+                print(f"{module:<28} {before:.3f}s -> {after:.3f}s ({after / before - 1:+.1%})")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())